@@ -1 +1,11 @@
-from .aws_lambda import AWSLambdaBackend as ComputeBackend
+from .aws_lambda import AWSLambdaBackend
+from .sharding import ShardedLambdaBackend
+
+
+def ComputeBackend(aws_lambda_config):
+    """
+    Returns a sharded backend when several targets (regions/accounts) are configured
+    """
+    if aws_lambda_config.get('targets'):
+        return ShardedLambdaBackend(aws_lambda_config)
+    return AWSLambdaBackend(aws_lambda_config)
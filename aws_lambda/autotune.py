@@ -0,0 +1,179 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import re
+import json
+import math
+import time
+import base64
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from . import config as aws_lambda_config
+from .timing import percentile
+
+logger = logging.getLogger(__name__)
+
+REPORT_DURATION = re.compile(r'\tDuration: ([0-9.]+) ms')
+
+
+class LambdaCostModel:
+    """
+    Cost of Lambda invocations: GB-seconds of billed duration plus a fixed price per request
+    """
+
+    def __init__(self, price_per_gb_second=aws_lambda_config.PRICE_PER_GB_SECOND,
+                 price_per_request=aws_lambda_config.PRICE_PER_REQUEST,
+                 billing_granularity=aws_lambda_config.BILLING_GRANULARITY):
+        self.price_per_gb_second = price_per_gb_second
+        self.price_per_request = price_per_request
+        self.billing_granularity = billing_granularity
+
+    def billed_duration(self, duration):
+        """
+        Rounds a duration (s) up to the billing granularity
+        """
+        units = math.ceil(round(duration / self.billing_granularity, 6))
+        return max(1, units) * self.billing_granularity
+
+    def cost(self, memory, duration):
+        """
+        Cost of one invocation of 'duration' seconds with 'memory' MB
+        """
+        return self.billed_duration(duration) * memory / 1024.0 * self.price_per_gb_second + self.price_per_request
+
+
+def recommend_memory(timings, objective='cost', max_latency=None, max_cost=None,
+                     cost_model=None, statistic=50):
+    """
+    Picks the best memory size from recorded timings. Candidates are compared by the given
+    percentile of their durations: 'cost' picks the cheapest size whose latency is under
+    'max_latency', 'latency' picks the fastest size whose cost is under 'max_cost'.
+    :param timings: dict of {memory: [durations (s)]}
+    return : dict with the recommended 'memory' and the evaluated 'candidates'
+    """
+    if objective not in ('cost', 'latency'):
+        raise Exception("Unknown autotuning objective '{}': use 'cost' or 'latency'".format(objective))
+    cost_model = cost_model or LambdaCostModel()
+
+    candidates = []
+    for memory, durations in sorted(timings.items()):
+        if not durations:
+            continue
+        duration = percentile(durations, statistic)
+        cost = sum(cost_model.cost(memory, d) for d in durations) / len(durations)
+        candidates.append({'memory': memory, 'duration': duration, 'cost': cost, 'samples': len(durations)})
+
+    eligible = [c for c in candidates
+                if (max_latency is None or c['duration'] <= max_latency)
+                and (max_cost is None or c['cost'] <= max_cost)]
+    if not eligible:
+        raise Exception('No memory size meets the given latency/cost constraints')
+
+    if objective == 'cost':
+        best = min(eligible, key=lambda c: (c['cost'], c['duration']))
+    else:
+        best = min(eligible, key=lambda c: (c['duration'], c['cost']))
+
+    return {'memory': best['memory'], 'objective': objective, 'candidates': candidates}
+
+
+class MemoryAutotuner:
+    """
+    Runs a sample of a map's tasks with several memory sizes and recommends the best one.
+    Every sample task is invoked synchronously and its duration is taken from the Lambda
+    execution report, so measurements exclude client-side latency. Before the samples of
+    a memory size run, as many containers as concurrent samples are warmed up, so cold
+    starts do not skew the results.
+    """
+
+    def __init__(self, compute_backend, runtime_name, memory_sizes=aws_lambda_config.AUTOTUNE_MEMORY_SIZES,
+                 cost_model=None):
+        self.compute_backend = compute_backend
+        self.runtime_name = runtime_name
+        self.memory_sizes = memory_sizes
+        self.cost_model = cost_model or LambdaCostModel()
+        self.timings = {}
+        self.created = []
+
+    def _invoke_sample(self, function_name, payload):
+        start = time.time()
+        response = self.compute_backend.client.invoke(
+            FunctionName=function_name,
+            Payload=json.dumps(payload),
+            LogType='Tail'
+        )
+        duration = time.time() - start
+        log_tail = base64.b64decode(response.get('LogResult', '')).decode(errors='replace')
+        match = REPORT_DURATION.search(log_tail)
+        if match:
+            duration = float(match.group(1)) / 1000.0
+        if 'FunctionError' in response:
+            raise Exception('Sample task failed: {}'.format(response['Payload'].read()))
+        return duration
+
+    def measure(self, payloads, repetitions=1):
+        """
+        Deploys the runtime with every memory size and runs the sample payloads on it
+        :param payloads: sample of the map's invocation payloads
+        return : dict of {memory: [durations (s)]}
+        """
+        deployed = set(function_name for function_name, _ in self.compute_backend.list_runtimes())
+        for memory in self.memory_sizes:
+            function_name = self.compute_backend._format_action_name(self.runtime_name, memory)
+            if function_name not in deployed:
+                self.created.append(memory)
+            self.compute_backend.create_runtime(self.runtime_name, memory)
+            self.compute_backend._wait_function_ready(function_name)
+
+            samples = list(payloads) * repetitions
+            workers = max(1, min(len(samples), aws_lambda_config.AUTOTUNE_MAX_CONCURRENCY))
+
+            # Start one container per concurrent sample. The warm-up requests hold their containers
+            # until all of them are started, then the containers stay warm and idle for the samples
+            self.compute_backend.warm_up(self.runtime_name, memory, count=workers,
+                                         hold=aws_lambda_config.WARM_UP_HOLD)
+
+            def invoke_sample(payload):
+                return self._invoke_sample(function_name, payload)
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                durations = list(executor.map(invoke_sample, samples))
+            self.timings.setdefault(memory, []).extend(durations)
+            logger.debug('Autotuning {}MB - p50 duration: {}s'.format(memory, percentile(durations, 50)))
+
+        return self.timings
+
+    def recommend(self, objective='cost', max_latency=None, max_cost=None, statistic=50):
+        """
+        Recommends a memory size from the measured timings, see recommend_memory()
+        """
+        return recommend_memory(self.timings, objective, max_latency, max_cost, self.cost_model, statistic)
+
+    def tune(self, payloads, objective='cost', max_latency=None, max_cost=None,
+             keep_recommended=False, cleanup=True):
+        """
+        Measures the sample payloads and recommends a memory size. With 'cleanup', the runtimes
+        deployed only for autotuning are deleted, except the recommended one if 'keep_recommended'
+        is set. The recommendation is not applied: set it as 'runtime_memory' of the map.
+        return : recommendation dict
+        """
+        self.measure(payloads)
+        recommendation = self.recommend(objective, max_latency, max_cost)
+        if cleanup:
+            for memory in self.created:
+                if not keep_recommended or memory != recommendation['memory']:
+                    self.compute_backend.delete_runtime(self.runtime_name, memory)
+        return recommendation
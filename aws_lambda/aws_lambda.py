@@ -15,9 +15,12 @@
 #
 
 import os
+import base64
 import shutil
+import hashlib
 import logging
-import boto3
+import platform
+import botocore
 import time
 import json
 import zipfile
@@ -25,9 +28,16 @@ import sys
 import subprocess
 import tempfile
 import textwrap
+from concurrent.futures import ThreadPoolExecutor
 import pywren_ibm_cloud
-from pywren_ibm_cloud.compute.utils import create_function_handler_zip
+from pywren_ibm_cloud.utils import version_str
+from pywren_ibm_cloud.config import JOBS_PREFIX
+from pywren_ibm_cloud.storage.backends.aws_s3.client_pool import client_pool
 from . import config as aws_lambda_config
+from .throttling import InvocationRateController, InvocationThrottledError
+from .timing import aggregate_timings
+from .payload import PayloadEncoder
+from .tree_invoker import split_payloads, build_tree_nodes, failures_prefix
 
 logger = logging.getLogger(__name__)
 
@@ -44,18 +54,33 @@ class AWSLambdaBackend:
         self.package = 'pywren_v'+pywren_ibm_cloud.__version__
         self.region = aws_lambda_config['region']
         self.role = aws_lambda_config['execution_role']
+        self.storage_bucket = aws_lambda_config.get('storage_bucket')
+        self.storage_client = None
+        self.warm_up_executor = None
+        self.payload_encoder = None
         self.layer_key = self.package.replace('.', '-')+'_dependencies'
+        self.invoke_pool_size = aws_lambda_config['invoke_pool_size']
+        self.invoke_retries = aws_lambda_config['invoke_retries']
+        self.rate_controller = InvocationRateController(initial_rate=aws_lambda_config['invoke_rate'],
+                                                        max_rate=aws_lambda_config['invoke_max_rate'])
 
-        self.session = boto3.Session(aws_access_key_id=aws_lambda_config['access_key_id'],
-                                     aws_secret_access_key=aws_lambda_config['secret_access_key'],
-                                     region_name=self.region)
-        self.client = self.session.client('lambda', region_name=self.region)
+        self.client = self._get_client('lambda', max_pool_connections=self.invoke_pool_size)
 
         log_msg = 'Pywren v{} init for AWS Lambda - Region: {}'.format(pywren_ibm_cloud.__version__, self.region)
         logger.info(log_msg)
         if not self.log_active:
             print(log_msg)
 
+    def _get_client(self, service, **client_args):
+        """
+        Returns the process-wide shared client of a service for this backend's region and credentials
+        """
+        return client_pool.get_client(service,
+                                      region_name=self.region,
+                                      access_key_id=self.aws_lambda_config['access_key_id'],
+                                      secret_access_key=self.aws_lambda_config['secret_access_key'],
+                                      **client_args)
+
     def _format_action_name(self, runtime_name, runtime_memory):
         runtime_name = (self.package+'_'+runtime_name).replace('.', '-')
         return '{}_{}MB'.format(runtime_name, runtime_memory)
@@ -66,20 +91,59 @@ class AWSLambdaBackend:
         runtime_memory = int(split[2].replace('MB', ''))
         return runtime_name, runtime_memory
         
-    def _check_dependencies_layer(self, runtime_name):
+    def _check_dependencies_layer(self, runtime_name, layer_hash=None):
         """
-        Checks if Cloudbutton dependencies layer is already deployed
+        Checks if Cloudbutton dependencies layer is already deployed.
+        If a layer hash is given, only a layer version built from the same content matches.
         returns : arn if deployed, else None
         """
         layers = self.list_layers(runtime_name)
         dep_layer = list(filter(lambda x: x['LayerName'] == self.layer_key, layers))
-        if len(dep_layer) != 0:
-            layer = dep_layer.pop()
-            arn = layer['LatestMatchingVersion']['LayerVersionArn']
-        else:
-            arn = None
-        return arn
-    
+        if len(dep_layer) == 0:
+            return None
+
+        layer = dep_layer.pop()
+        if layer_hash is None or layer['LatestMatchingVersion'].get('Description', '').endswith(layer_hash):
+            return layer['LatestMatchingVersion']['LayerVersionArn']
+
+        # The latest version was built from other content, look for an older matching version
+        response = self.client.list_layer_versions(
+            CompatibleRuntime=runtime_name,
+            LayerName=self.layer_key
+        )
+        for layer_version in response['LayerVersions']:
+            if layer_version.get('Description', '').endswith(layer_hash):
+                return layer_version['LayerVersionArn']
+        return None
+
+    def _get_dependencies(self):
+        """
+        Get modules name & version from requirements.txt
+        return : list of requirement specifiers
+        """
+        base_path = os.path.dirname(os.path.abspath(pywren_ibm_cloud.__file__))
+        requirements_path = os.path.join(base_path, 'compute', 'backends', 'aws_lambda', 'requirements.txt')
+
+        with open(requirements_path, 'r') as requirements_file:
+            dependencies = requirements_file.readlines()
+
+        dependencies = list(filter(lambda x : x.rstrip(), dependencies))
+        dependencies = list(map(lambda x : x.replace('\n', ''), dependencies))
+        return dependencies
+
+    def _get_dependencies_layer_hash(self, runtime_name, dependencies):
+        """
+        Content hash of the dependencies layer: requirements, target runtime and build platform
+        return : hex digest
+        """
+        layer_hash = hashlib.sha256()
+        for dependency in sorted(dependencies):
+            layer_hash.update(dependency.strip().encode()+b'\n')
+        layer_hash.update(runtime_name.encode()+b'\n')
+        layer_hash.update('{}-{}-py{}'.format(sys.platform, platform.machine(),
+                                              version_str(sys.version_info)).encode())
+        return layer_hash.hexdigest()[:32]
+
     def _get_scipy_layer_arn(self, runtime_name):
         """
         Retruns arn for the existing numerics lambda layer basen on region
@@ -102,9 +166,10 @@ class AWSLambdaBackend:
         arn = 'arn:aws:lambda:'+self.region+':'+str(acc_id[self.region])+':layer:AWSLambda-'+runtime_name+'-SciPy1x:2'
         return arn
     
-    def _build_dependencies_layer(self):
+    def _build_dependencies_layer(self, dependencies, layer_hash):
         """
-        Downloads and builds module dependencies for Cloudbutton lambda execution
+        Downloads and builds module dependencies for Cloudbutton lambda execution.
+        Built zips are kept in a local cache directory, keyed by the layer content hash.
         return : layer zip bytes
         """
         def add_folder_to_zip(zip_file, full_dir_path, sub_dir=''):
@@ -115,6 +180,12 @@ class AWSLambdaBackend:
                 elif os.path.isdir(full_path) and '__pycache__' not in full_path:
                     add_folder_to_zip(zip_file, full_path, os.path.join(sub_dir, file))
 
+        layer_zip_path = os.path.join(aws_lambda_config.LAYER_CACHE_DIR, '{}.zip'.format(layer_hash))
+        if os.path.isfile(layer_zip_path):
+            logger.debug('Using cached dependencies layer {}'.format(layer_zip_path))
+            with open(layer_zip_path, 'rb') as layer_zip:
+                return layer_zip.read()
+
         # Path where modules will be downloaded
         if os.path.exists(aws_lambda_config.LAYER_DIR_PATH) and os.path.isdir(aws_lambda_config.LAYER_DIR_PATH):
             shutil.rmtree(aws_lambda_config.LAYER_DIR_PATH)
@@ -122,89 +193,134 @@ class AWSLambdaBackend:
             os.remove(aws_lambda_config.LAYER_DIR_PATH)
         if not (os.path.isdir(aws_lambda_config.LAYER_DIR_PATH)):
             os.makedirs(aws_lambda_config.LAYER_DIR_PATH)
-        
-        # Get modules name & version from requirements.txt
-        base_path = os.path.dirname(os.path.abspath(pywren_ibm_cloud.__file__))
-        requirements_path = os.path.join(base_path, 'compute', 'backends', 'aws_lambda', 'requirements.txt')
-        dependencies = []
+        if not (os.path.isdir(aws_lambda_config.LAYER_CACHE_DIR)):
+            os.makedirs(aws_lambda_config.LAYER_CACHE_DIR)
 
-        with open(requirements_path, 'r') as requirements_file:
-            dependencies = requirements_file.readlines()
-        
-        # Install modules
-        dependencies = list(filter(lambda x : x.rstrip(), dependencies))
-        dependencies = list(map(lambda x : x.replace('\n', ''), dependencies))
+        # Install modules, reusing pip's wheel cache across builds
         # old_stdout = sys.stdout     # Disable stdout
         # sys.stdout = open(os.devnull, 'w')
-        subprocess.check_call([sys.executable, '-m', 'pip', 'install', '-t', aws_lambda_config.LAYER_DIR_PATH, '--system'] + dependencies)
+        subprocess.check_call([sys.executable, '-m', 'pip', 'install', '-t', aws_lambda_config.LAYER_DIR_PATH,
+                               '--cache-dir', aws_lambda_config.PIP_CACHE_DIR, '--system'] + dependencies)
         # sys.stdout = old_stdout
 
         # Compress modules
         with zipfile.ZipFile(aws_lambda_config.LAYER_ZIP_PATH, 'w') as layer_zip:
             add_folder_to_zip(layer_zip, os.path.join(tempfile.gettempdir(), 'modules'))
+        shutil.copyfile(aws_lambda_config.LAYER_ZIP_PATH, layer_zip_path + '.tmp')
+        os.replace(layer_zip_path + '.tmp', layer_zip_path)
 
         # Read zip as bytes
-        with open(aws_lambda_config.LAYER_ZIP_PATH, 'rb') as layer_zip:
+        with open(layer_zip_path, 'rb') as layer_zip:
             layer_bytes = layer_zip.read()
-        
+
         return layer_bytes
-    
+
     def _setup_layers(self, runtime_name):
         """
-        Setups and creates lambda layers for Cloudbutton function execution
+        Setups and creates lambda layers for Cloudbutton function execution.
+        The dependencies layer is only rebuilt and republished when its content hash changes.
         """
         layers_arn = []
-        dependencies_layer = self._check_dependencies_layer(runtime_name)
+        dependencies = self._get_dependencies()
+        layer_hash = self._get_dependencies_layer_hash(runtime_name, dependencies)
+        dependencies_layer = self._check_dependencies_layer(runtime_name, layer_hash)
 
         if dependencies_layer is None:
-            layer_bytes = self._build_dependencies_layer()
+            layer_bytes = self._build_dependencies_layer(dependencies, layer_hash)
             # Upload dependencies layer from bytes zip
             dependencies_layer = self.create_layer(
                 self.layer_key,
                 runtime_name,
-                layer_bytes)
-        
+                layer_bytes,
+                description='{} {}'.format(self.package, layer_hash))
+
         layers_arn.append(dependencies_layer)
         layers_arn.append(self._get_scipy_layer_arn(runtime_name))
-        return layers_arn      
-    
+        return layers_arn
+
     def build_runtime(self):
         pass
 
-    def update_runtime(self, runtime_name, code, memory=3008, timeout=900):
+    def _create_handler_zip(self):
         """
-        Updates code, memory and time of existing lambda function
+        Creates the function handler zip (entry point as '__main__.py' plus the pywren_ibm_cloud module).
+        Entries are sorted and timestamps fixed, so the same sources always produce the same zip
+        and the same CodeSha256.
+        return : zip bytes
         """
-        function_name = self._format_action_name(runtime_name, memory)        
+        current_location = os.path.dirname(os.path.abspath(__file__))
+        module_location = os.path.dirname(os.path.abspath(pywren_ibm_cloud.__file__))
+
+        entries = [(os.path.join(current_location, 'entry_point.py'), '__main__.py')]
+        for root, dirs, files in os.walk(module_location):
+            dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+            for file in sorted(files):
+                full_path = os.path.join(root, file)
+                arc_path = os.path.join('pywren_ibm_cloud', os.path.relpath(full_path, module_location))
+                entries.append((full_path, arc_path))
+
+        with zipfile.ZipFile(aws_lambda_config.ACTION_ZIP_PATH, 'w') as action_zip:
+            for full_path, arc_path in entries:
+                zip_info = zipfile.ZipInfo(arc_path, date_time=aws_lambda_config.ZIP_DATE_TIME)
+                zip_info.compress_type = zipfile.ZIP_DEFLATED
+                zip_info.external_attr = 0o644 << 16
+                with open(full_path, 'rb') as entry_file:
+                    action_zip.writestr(zip_info, entry_file.read())
+
+        with open(aws_lambda_config.ACTION_ZIP_PATH, "rb") as action_zip:
+            return action_zip.read()
+
+    def update_runtime(self, runtime_name, code, memory=3008, timeout=900, layers=None, deployed=None):
+        """
+        Updates code, memory and time of existing lambda function.
+        Code and configuration are only pushed if they differ from the deployed ones.
+        :param deployed: current function configuration, if it was already fetched
+        """
+        function_name = self._format_action_name(runtime_name, memory)
         logger.debug('Updating function {} code/config'.format(function_name))
 
-        response = self.client.update_function_code(
-            FunctionName=function_name,
-            ZipFile=code,
-            Publish=False
-        )
+        if deployed is None:
+            deployed = self.client.get_function_configuration(FunctionName=function_name)
+        code_sha256 = base64.b64encode(hashlib.sha256(code).digest()).decode()
 
-        if response['ResponseMetadata']['HTTPStatusCode'] == 201:
-            logger.debug("OK --> Updated function code {}".format(function_name))
+        if deployed['CodeSha256'] != code_sha256:
+            self._wait_function_ready(function_name)
+            response = self.client.update_function_code(
+                FunctionName=function_name,
+                ZipFile=code,
+                Publish=False
+            )
+
+            if response['ResponseMetadata']['HTTPStatusCode'] == 200:
+                logger.debug("OK --> Updated function code {}".format(function_name))
+            else:
+                msg = 'An error occurred updating function code {}: {}'.format(function_name, response)
+                raise Exception(msg)
         else:
-            msg = 'An error occurred updating function code {}: {}'.format(function_name, response)
-            raise Exception(msg)
+            logger.debug("Function {} code is up to date".format(function_name))
 
-        layers = self._setup_layers(runtime_name)
+        if layers is None:
+            layers = self._setup_layers(runtime_name)
 
-        response = self.client.update_function_configuration(
-            FunctionName=function_name,
-            Role=self.role,
-            Timeout=timeout,
-            MemorySize=memory,
-            Layers=layers
-        )
+        deployed_layers = [layer['Arn'] for layer in deployed.get('Layers', [])]
+        if (deployed['Role'], deployed['Timeout'], deployed['MemorySize'], deployed_layers) != \
+           (self.role, timeout, memory, layers):
+            self._wait_function_ready(function_name)
+            response = self.client.update_function_configuration(
+                FunctionName=function_name,
+                Role=self.role,
+                Timeout=timeout,
+                MemorySize=memory,
+                Layers=layers
+            )
 
-        if response['ResponseMetadata']['HTTPStatusCode'] == 201:
-            logger.debug("OK --> Updated function config {}".format(function_name))
+            if response['ResponseMetadata']['HTTPStatusCode'] == 200:
+                logger.debug("OK --> Updated function config {}".format(function_name))
+            else:
+                msg = 'An error occurred updating function config {}: {}'.format(function_name, response)
+                raise Exception(msg)
         else:
-            msg = 'An error occurred updating function config {}: {}'.format(function_name, response)
-            raise Exception(msg)
+            logger.debug("Function {} config is up to date".format(function_name))
 
     def create_runtime(self, runtime_name, memory=3008, code=None, timeout=900):
         """
@@ -215,37 +331,50 @@ class AWSLambdaBackend:
 
         layers = self._setup_layers(runtime_name)
 
-        runtime_meta = self._generate_runtime_meta(runtime_name)
+        runtime_meta_key = self._get_runtime_meta_key(runtime_name, layers)
+        runtime_meta = self._load_runtime_meta(runtime_meta_key)
 
         if code is None:
-            create_function_handler_zip(aws_lambda_config.ACTION_ZIP_PATH, '__main__.py', __file__)
-            with open(aws_lambda_config.ACTION_ZIP_PATH, "rb") as action_zip:
-                code = action_zip.read()
+            code = self._create_handler_zip()
 
         try:
-            response = self.client.create_function(
-                FunctionName=function_name,
-                Runtime=runtime_name,
-                Role=self.role,
-                Handler='__main__.main',
-                Code={
-                    'ZipFile': code
-                },
-                Description=self.package,
-                Timeout=timeout,
-                MemorySize=memory,
-                Layers=layers
-            )
+            deployed = self.client.get_function_configuration(FunctionName=function_name)
+        except self.client.exceptions.ResourceNotFoundException:
+            deployed = None
+
+        if deployed is not None:
+            logger.debug('{} lambda function already exists. It will be updated.'.format(function_name))
+            self.update_runtime(runtime_name, code, memory, timeout, layers, deployed)
+        else:
+            try:
+                response = self.client.create_function(
+                    FunctionName=function_name,
+                    Runtime=runtime_name,
+                    Role=self.role,
+                    Handler='__main__.main',
+                    Code={
+                        'ZipFile': code
+                    },
+                    Description=self.package,
+                    Timeout=timeout,
+                    MemorySize=memory,
+                    Layers=layers
+                )
+
+                if response['ResponseMetadata']['HTTPStatusCode'] == 201:
+                    logger.debug("OK --> Created action {}".format(runtime_name))
+                else:
+                    msg = 'An error occurred creating/updating action {}: {}'.format(runtime_name, response)
+                    raise Exception(msg)
+            except self.client.exceptions.ResourceConflictException:
+                # Created concurrently (e.g. by another client) since it was looked up
+                logger.debug('{} lambda function already exists. It will be updated.'.format(function_name))
+                self.update_runtime(runtime_name, code, memory, timeout, layers)
+
+        if runtime_meta is None:
+            runtime_meta = self._extract_runtime_meta(runtime_name, memory)
+            self._store_runtime_meta(runtime_meta_key, runtime_meta)
 
-            if response['ResponseMetadata']['HTTPStatusCode'] == 201:
-                logger.debug("OK --> Created action {}".format(runtime_name))
-            else:
-                msg = 'An error occurred creating/updating action {}: {}'.format(runtime_name, response)
-                raise Exception(msg)        
-        except self.client.exceptions.ResourceConflictException:
-            logger.debug('{} lambda function already exists. It will be replaced.')
-            self.update_runtime(runtime_name, code, memory, timeout)
-        
         return runtime_meta
 
     def delete_runtime(self, runtime_name, memory):
@@ -297,14 +426,14 @@ class AWSLambdaBackend:
             runtimes.append((function_name, memory))
         return runtimes
 
-    def create_layer(self, layer_name, runtime_name, zipfile):
+    def create_layer(self, layer_name, runtime_name, zipfile, description=None):
         """
         Creates lambda layer from bin code
         """
         logger.debug("Creating lambda layer: {}".format(layer_name))
         response = self.client.publish_layer_version(
             LayerName=layer_name,
-            Description=self.package,
+            Description=description or self.package,
             Content={
                 'ZipFile': zipfile
             },
@@ -350,48 +479,226 @@ class AWSLambdaBackend:
 
         return response['Layers']
 
-    def invoke(self, runtime_name, runtime_memory, payload, self_invoked=False):
+    def invoke(self, runtime_name, runtime_memory, payload):
         """
         Invoke lambda function asynchronously
+        return : activation ID, or None if the invocation was still throttled after its retries.
+                 Other errors (e.g. 5xx responses or network errors after the retries) are raised
+        """
+        try:
+            return self._invoke(runtime_name, runtime_memory, payload)
+        except InvocationThrottledError:
+            return None
+
+    def _invoke(self, runtime_name, runtime_memory, payload):
+        """
+        Invoke lambda function asynchronously, pacing requests through the rate controller and
+        retrying throttled or failed requests with jittered exponential backoff
         """
         exec_id = payload['executor_id']
         call_id = payload['call_id']
 
         function_name = self._format_action_name(runtime_name, runtime_memory)
+        encoded_payload = self._encode_payload(payload)
+
+        attempt = 0
+        while True:
+            self.rate_controller.acquire()
+            start = time.time()
+            try:
+                response = self.client.invoke(
+                    FunctionName=function_name,
+                    InvocationType='Event',
+                    Payload=encoded_payload
+                )
+                status_code = response['ResponseMetadata']['HTTPStatusCode']
+                error = None
+            except botocore.exceptions.ClientError as e:
+                response = e.response
+                status_code = e.response['ResponseMetadata'].get('HTTPStatusCode')
+                if e.response['Error']['Code'] == 'TooManyRequestsException':
+                    status_code = 429
+                error = e
+            except botocore.exceptions.BotoCoreError as e:
+                # Network errors: connection refused/closed, timeouts...
+                status_code = None
+                error = e
+
+            roundtrip = time.time() - start
+            resp_time = format(round(roundtrip, 3), '.3f')
+
+            if status_code == 202:
+                self.rate_controller.on_success(roundtrip)
+                log_msg = ('ExecutorID {} - Function {} invocation done! ({}s) - Activation ID: '
+                           '{}'.format(exec_id, call_id, resp_time, response['ResponseMetadata']['RequestId']))
+                logger.debug(log_msg)
+                return response['ResponseMetadata']['RequestId']
+            elif status_code == 401:
+                raise Exception('Unauthorized - Invalid API Key')
+            elif status_code == 404:
+                raise Exception('Cloudbutton Runtime: {} not deployed'.format(runtime_name))
+            elif status_code == 429:
+                # Too many concurrent requests in flight
+                self.rate_controller.on_throttle(roundtrip)
+            elif status_code is None or status_code >= 500:
+                self.rate_controller.on_error(roundtrip)
+            else:
+                logger.debug(response)
+                raise error if error is not None else Exception(response)
 
-        start = time.time()
-        try:
-            response = self.client.invoke(
-                FunctionName=function_name,
-                InvocationType='Event',
-                Payload=json.dumps(payload)
-            )
-        except Exception as e:
-            log_msg = ('ExecutorID {} - Function {} invocation failed: {}'.format(exec_id, call_id, str(e)))
+            log_msg = ('ExecutorID {} - Function {} invocation failed (attempt {}/{}): {}'
+                       .format(exec_id, call_id, attempt + 1, self.invoke_retries + 1, error or response))
             logger.debug(log_msg)
-            if self_invoked:
-                return None
-            return self.invoke(runtime_name, runtime_memory, payload, self_invoked=True)
 
-        roundtrip = time.time() - start
-        resp_time = format(round(roundtrip, 3), '.3f')
+            if attempt >= self.invoke_retries or not self.rate_controller.acquire_retry():
+                if status_code == 429:
+                    raise InvocationThrottledError(function_name, attempt + 1)
+                raise error if error is not None else Exception(response)
 
-        if response['ResponseMetadata']['HTTPStatusCode'] == 202:
-            log_msg = ('ExecutorID {} - Function {} invocation done! ({}s) - Activation ID: '
-                       '{}'.format(exec_id, call_id, resp_time, response['ResponseMetadata']['RequestId']))
-            logger.debug(log_msg)
-            return response['ResponseMetadata']['RequestId']
-        else:
-            logger.debug(response)
-            if response['ResponseMetadata']['HTTPStatusCode'] == 401:
-                raise Exception('Unauthorized - Invalid API Key')
-            elif response['ResponseMetadata']['HTTPStatusCode'] == 404:
-                raise Exception('Cloudbutton Runtime: {} not deployed'.format(runtime_name))
-            elif response['ResponseMetadata']['HTTPStatusCode'] == 429:
-                # Too many concurrent requests in flight
+            time.sleep(self.rate_controller.backoff(attempt))
+            attempt += 1
+
+    def invocation_stats(self):
+        """
+        Returns the current invocation rate, and the throttle/error/retry counters
+        """
+        return self.rate_controller.stats()
+
+    def invoke_batch(self, runtime_name, runtime_memory, payloads):
+        """
+        Invoke lambda function asynchronously once per payload, dispatching
+        the invocations concurrently over the pooled connections
+        return : list with the activation ID, or the exception raised, of each payload (in input order).
+                 Calls that remained throttled are reported as InvocationThrottledError
+        """
+        def invoke_one(payload):
+            try:
+                return self._invoke(runtime_name, runtime_memory, payload)
+            except Exception as e:
+                return e
+
+        payloads = list(payloads)
+        self.rate_controller.reserve_retries(len(payloads))
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.invoke_pool_size) as executor:
+            results = list(executor.map(invoke_one, payloads))
+
+        failed = sum(1 for r in results if isinstance(r, Exception))
+        logger.debug('Batch of {} invocations dispatched in {}s - {} failed'
+                     .format(len(results), format(round(time.time() - start, 3), '.3f'), failed))
+        return results
+
+    def invoke_tree(self, runtime_name, runtime_memory, payloads,
+                    branching_factor=aws_lambda_config.TREE_BRANCHING_FACTOR,
+                    leaf_size=aws_lambda_config.TREE_LEAF_SIZE,
+                    max_depth=aws_lambda_config.TREE_MAX_DEPTH):
+        """
+        Invoke lambda function once per payload through a tree of invoker functions.
+        The client only invokes up to 'branching_factor' invoker nodes; every node splits its slice
+        of calls again until slices have at most 'leaf_size' calls (or 'max_depth' is reached),
+        and the leaves invoke the workers. Fields shared by all the payloads are sent once per node.
+        Nodes record the calls they could not invoke, see reinvoke_tree_failures().
+        return : list with the activation ID, or the exception raised, of each first-level node
+        """
+        if len(payloads) <= leaf_size:
+            return self.invoke_batch(runtime_name, runtime_memory, payloads)
+
+        function_name = self._format_action_name(runtime_name, runtime_memory)
+        template, calls = split_payloads(payloads)
+        template = self._get_payload_encoder().share_parts(template)
+        invoke_config = {'pool_size': self.invoke_pool_size,
+                         'retries': self.invoke_retries,
+                         'rate': self.aws_lambda_config['invoke_rate'],
+                         'max_rate': self.aws_lambda_config['invoke_max_rate']}
+        nodes = build_tree_nodes(function_name, template, calls, branching_factor,
+                                 leaf_size, max_depth, self._get_payload_config(), invoke_config)
+        logger.debug('ExecutorID {} - Invoking {} calls through {} tree invoker nodes'
+                     .format(template.get('executor_id'), len(calls), len(nodes)))
+        return self.invoke_batch(runtime_name, runtime_memory, nodes)
+
+    def get_tree_failures(self, executor_id, job_id):
+        """
+        Reads the calls that the nodes of an invoke_tree() job could not invoke
+        return : dict of {failures key: list of payloads}
+        """
+        if self.storage_bucket is None:
+            raise Exception("'storage_bucket' is required to read tree invoker failures")
+
+        storage_client = self._get_storage_client()
+        paginator = storage_client.get_paginator('list_objects_v2')
+        prefix = failures_prefix(JOBS_PREFIX, executor_id, job_id)
+        failures = {}
+        for page in paginator.paginate(Bucket=self.storage_bucket, Prefix=prefix):
+            for item in page.get('Contents', []):
+                response = storage_client.get_object(Bucket=self.storage_bucket, Key=item['Key'])
+                record = json.loads(response['Body'].read())
+                failures[item['Key']] = [{**record['template'], **call} for call in record['calls']]
+        return failures
+
+    def reinvoke_tree_failures(self, runtime_name, runtime_memory, executor_id, job_id):
+        """
+        Invokes again the calls that the nodes of an invoke_tree() job could not invoke.
+        Failure records are deleted once all their calls were accepted.
+        return : dict of {call_id: activation ID, or the exception raised}
+        """
+        failures = self.get_tree_failures(executor_id, job_id)
+        payloads = [payload for key_payloads in failures.values() for payload in key_payloads]
+        if not payloads:
+            return {}
+        logger.debug('ExecutorID {} - Invoking again {} calls of job {} failed by tree invoker nodes'
+                     .format(executor_id, len(payloads), job_id))
+        results = dict(zip((p['call_id'] for p in payloads),
+                           self.invoke_batch(runtime_name, runtime_memory, payloads)))
+
+        storage_client = self._get_storage_client()
+        for key, key_payloads in failures.items():
+            if not any(isinstance(results[p['call_id']], Exception) for p in key_payloads):
+                storage_client.delete_object(Bucket=self.storage_bucket, Key=key)
+        return results
+
+    def warm_up(self, runtime_name, runtime_memory, count, hold=aws_lambda_config.WARM_UP_HOLD):
+        """
+        Starts containers ahead of a large map by firing 'count' concurrent no-op invocations.
+        Each one holds its container for 'hold' seconds, so that concurrent requests are served
+        by different containers.
+        return : report dict with the number of containers that responded cold/warm
+        """
+        function_name = self._format_action_name(runtime_name, runtime_memory)
+        max_workers = max(1, min(count, aws_lambda_config.WARM_UP_MAX_CONCURRENCY))
+        client = self._get_client('lambda', max_pool_connections=max_workers, read_timeout=hold + 60)
+        payload = json.dumps({'warm_up': {'hold': hold}})
+
+        def warm_up_one(i):
+            try:
+                response = client.invoke(FunctionName=function_name, Payload=payload)
+                return json.loads(response['Payload'].read())
+            except Exception as e:
+                logger.debug('Function {} warm-up request failed: {}'.format(function_name, e))
                 return None
-            else:
-                raise Exception(response)
+
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            responses = list(executor.map(warm_up_one, range(count)))
+
+        states = [r for r in responses if isinstance(r, dict) and 'container_id' in r]
+        report = {'requested': count,
+                  'responded': len(states),
+                  'failed': count - len(states),
+                  'cold': sum(1 for r in states if r['cold']),
+                  'warm': sum(1 for r in states if not r['cold']),
+                  'containers': len(set(r['container_id'] for r in states)),
+                  'duration': round(time.time() - start, 3)}
+        logger.debug('Function {} warm-up: {}'.format(function_name, report))
+        return report
+
+    def schedule_warm_up(self, runtime_name, runtime_memory, count, hold=aws_lambda_config.WARM_UP_HOLD):
+        """
+        Runs warm_up() in the background, e.g. right before an invoke_batch() dispatch
+        return : future of the warm-up report
+        """
+        if self.warm_up_executor is None:
+            self.warm_up_executor = ThreadPoolExecutor(max_workers=1)
+        return self.warm_up_executor.submit(self.warm_up, runtime_name, runtime_memory, count, hold)
 
     def invoke_with_result(self, runtime_name, runtime_memory, payload={}):
         """
@@ -406,6 +713,36 @@ class AWSLambdaBackend:
 
         return json.loads(response['Payload'].read())
 
+    def get_timings(self, executor_id, job_id=None):
+        """
+        Downloads the timing records stored by the calls of an executor (or of one of its jobs).
+        Calls only store them if 'store_timings' is enabled in the 'aws_lambda' config.
+        return : list of timing dicts
+        """
+        if self.storage_bucket is None:
+            raise Exception("'storage_bucket' is required to read timing records")
+
+        prefix = '/'.join([JOBS_PREFIX, executor_id] + ([job_id] if job_id else [])) + '/'
+        storage_client = self._get_storage_client()
+        paginator = storage_client.get_paginator('list_objects_v2')
+        timing_keys = [item['Key']
+                       for page in paginator.paginate(Bucket=self.storage_bucket, Prefix=prefix)
+                       for item in page.get('Contents', []) if item['Key'].endswith('/timing.json')]
+
+        def get_timing(key):
+            response = storage_client.get_object(Bucket=self.storage_bucket, Key=key)
+            return json.loads(response['Body'].read())
+
+        with ThreadPoolExecutor(max_workers=self.invoke_pool_size) as executor:
+            return list(executor.map(get_timing, timing_keys))
+
+    def get_timing_summary(self, executor_id, job_id=None, percentiles=(50, 90, 99)):
+        """
+        Percentiles of the per-phase durations (import, init, handler...) of an executor's calls
+        return : summary dict, see timing.aggregate_timings()
+        """
+        return aggregate_timings(self.get_timings(executor_id, job_id), percentiles)
+
     def get_runtime_key(self, runtime_name, runtime_memory):
         """
         Method that creates and returns the runtime key.
@@ -417,6 +754,128 @@ class AWSLambdaBackend:
 
         return runtime_key
     
+    def _get_storage_client(self):
+        """
+        Lazily creates the S3 client used to access the storage bucket
+        """
+        if self.storage_client is None:
+            self.storage_client = self._get_client('s3')
+        return self.storage_client
+
+    def _get_payload_config(self):
+        return {'bucket': self.storage_bucket,
+                'compress_threshold': self.aws_lambda_config['payload_compress_threshold'],
+                'offload_threshold': self.aws_lambda_config['payload_offload_threshold'],
+                'part_threshold': aws_lambda_config.PAYLOAD_PART_THRESHOLD}
+
+    def _get_payload_encoder(self):
+        if self.payload_encoder is None:
+            payload_config = self._get_payload_config()
+            storage_client = self._get_storage_client() if self.storage_bucket is not None else None
+            self.payload_encoder = PayloadEncoder(storage_client, payload_config['bucket'], JOBS_PREFIX,
+                                                  payload_config['compress_threshold'],
+                                                  payload_config['offload_threshold'],
+                                                  payload_config['part_threshold'])
+        return self.payload_encoder
+
+    def _encode_payload(self, payload):
+        """
+        Compresses the payload, or offloads it to the storage bucket, when it is too large
+        to be sent inline. See payload.PayloadEncoder.
+        return : JSON string
+        """
+        return self._get_payload_encoder().encode(payload)
+
+    def _get_runtime_meta_key(self, runtime_name, layers):
+        """
+        Runtime metadata only depends on the runtime, its layers and the package version
+        return : cache key
+        """
+        meta_hash = hashlib.sha256()
+        meta_hash.update(runtime_name.encode()+b'\n')
+        for layer_arn in sorted(layers):
+            meta_hash.update(layer_arn.encode()+b'\n')
+        meta_hash.update(self.package.encode())
+        return meta_hash.hexdigest()[:32]
+
+    def _load_runtime_meta(self, runtime_meta_key):
+        """
+        Looks up runtime metadata in the local cache, then in the storage bucket
+        return : runtime meta dictionary, or None if not cached
+        """
+        local_path = os.path.join(aws_lambda_config.RUNTIME_META_CACHE_DIR, runtime_meta_key+'.json')
+        if os.path.isfile(local_path):
+            with open(local_path, 'r') as meta_file:
+                logger.debug('Using cached runtime metadata {}'.format(local_path))
+                return json.load(meta_file)
+
+        if self.storage_bucket is None:
+            return None
+        try:
+            key = '/'.join([aws_lambda_config.RUNTIME_META_PREFIX, runtime_meta_key+'.json'])
+            response = self._get_storage_client().get_object(Bucket=self.storage_bucket, Key=key)
+            runtime_meta = json.loads(response['Body'].read())
+        except Exception as e:
+            logger.debug('Runtime metadata {} not found in storage: {}'.format(runtime_meta_key, e))
+            return None
+
+        logger.debug('Using runtime metadata from storage: {}'.format(key))
+        self._store_runtime_meta(runtime_meta_key, runtime_meta, local_only=True)
+        return runtime_meta
+
+    def _store_runtime_meta(self, runtime_meta_key, runtime_meta, local_only=False):
+        """
+        Saves runtime metadata to the local cache and to the storage bucket
+        """
+        if not os.path.isdir(aws_lambda_config.RUNTIME_META_CACHE_DIR):
+            os.makedirs(aws_lambda_config.RUNTIME_META_CACHE_DIR)
+        local_path = os.path.join(aws_lambda_config.RUNTIME_META_CACHE_DIR, runtime_meta_key+'.json')
+        with open(local_path, 'w') as meta_file:
+            json.dump(runtime_meta, meta_file)
+
+        if local_only or self.storage_bucket is None:
+            return
+        try:
+            key = '/'.join([aws_lambda_config.RUNTIME_META_PREFIX, runtime_meta_key+'.json'])
+            self._get_storage_client().put_object(Bucket=self.storage_bucket, Key=key,
+                                                  Body=json.dumps(runtime_meta).encode())
+        except Exception as e:
+            logger.debug('Unable to store runtime metadata {}: {}'.format(runtime_meta_key, e))
+
+    def _wait_function_ready(self, function_name, timeout=60):
+        """
+        Waits until a function is neither 'Pending' (just created) nor being updated
+        """
+        start = time.time()
+        while time.time() - start < timeout:
+            response = self.client.get_function_configuration(FunctionName=function_name)
+            if response.get('State', 'Active') != 'Pending' and \
+               response.get('LastUpdateStatus', 'Successful') != 'InProgress':
+                return response
+            time.sleep(1)
+        raise Exception('Function {} is not ready after {}s'.format(function_name, timeout))
+
+    def _extract_runtime_meta(self, runtime_name, memory):
+        """
+        Extract preinstalled Python modules from the first invocation of the deployed function.
+        Falls back to a throwaway probe function if the deployed code does not support it.
+        return : runtime meta dictionary
+        """
+        function_name = self._format_action_name(runtime_name, memory)
+        logger.debug("Extracting Python modules list from: {}".format(function_name))
+
+        self._wait_function_ready(function_name)
+        try:
+            runtime_meta = self.invoke_with_result(runtime_name, memory, {'get_preinstalls': True})
+        except Exception as e:
+            raise Exception("Unable to invoke function {}: {}".format(function_name, e))
+
+        if not isinstance(runtime_meta, dict) or 'preinstalls' not in runtime_meta:
+            logger.debug("Function {} did not return its runtime metadata".format(function_name))
+            runtime_meta = self._generate_runtime_meta(runtime_name)
+
+        return runtime_meta
+
     def _generate_runtime_meta(self, runtime_name):
         """
         Extract preinstalled Python modules from lambda function execution environment
@@ -22,12 +22,40 @@ from pywren_ibm_cloud.utils import version_str
 RUNTIME_TIMEOUT_DEFAULT = 900  # Default timeout: 900 s == 15 min
 RUNTIME_MEMORY_DEFAULT = 256  # Default memory: 256 MB
 RUNTIME_MEMORY_MAX = 3008  # Max. memory: 3008 MB
+AUTOTUNE_MEMORY_SIZES = (256, 512, 1024, 1536, 2048, 3008)  # Memory sizes (MB) evaluated by the autotuner
+AUTOTUNE_MAX_CONCURRENCY = 16  # Max. concurrent sample invocations (and warm containers) per memory size
+
+PRICE_PER_GB_SECOND = 0.0000166667  # USD per GB-s of billed duration
+PRICE_PER_REQUEST = 0.0000002  # USD per invocation request
+BILLING_GRANULARITY = 0.001  # Billed duration is rounded up to 1 ms
 
 MAX_CONCURRENT_WORKERS = 1000
+INVOKE_POOL_SIZE = 64  # Concurrent invocation requests (and pooled connections) per backend
+INVOKE_RETRIES = 5  # Retries of a throttled/failed invocation
+INVOKE_RATE = 500  # Initial invocation rate: 500 invocations/s
+INVOKE_MAX_RATE = 5000  # Max. invocation rate: 5000 invocations/s
+PAYLOAD_COMPRESS_THRESHOLD = 16 * 1024  # Payloads above 16 KiB are compressed
+PAYLOAD_OFFLOAD_THRESHOLD = 250 * 1000  # Payloads above 250 KB (async limit: 256 KB) are stored in the bucket
+PAYLOAD_PART_THRESHOLD = 16 * 1024  # Shared payload parts above 16 KiB are uploaded once and referenced
+TREE_BRANCHING_FACTOR = 16  # Children of every tree invoker node
+TREE_LEAF_SIZE = 64  # Max. workers invoked by a tree invoker leaf
+TREE_MAX_DEPTH = 4  # Max. depth of the tree of invokers
+WARM_UP_MAX_CONCURRENCY = 256  # Max. concurrent warm-up requests
+WARM_UP_HOLD = 1.0  # Time (s) each warm-up request holds its container
+STORE_TIMINGS = False  # Workers store a timing record per call in the storage bucket
+SHARD_INVOKE_RETRIES = 1  # Retries on the same target before a sharded invocation moves to another one
+SHARD_SLOT_TTL = 60  # Time (s) an asynchronous invocation is counted against its target's concurrency
+SHARD_THROTTLE_DECREASE = 0.5  # Target weight factor applied on every throttle
+SHARD_THROTTLE_RECOVERY = 0.05  # Target weight factor recovered on every accepted invocation
 
 LAYER_DIR_PATH = os.path.join(tempfile.gettempdir(), 'modules', 'python')
 LAYER_ZIP_PATH = os.path.join(tempfile.gettempdir(), 'pywren_dependencies.zip')
+LAYER_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'pywren_layers_cache')
+PIP_CACHE_DIR = os.path.join(LAYER_CACHE_DIR, 'pip')
 ACTION_ZIP_PATH = os.path.join(tempfile.gettempdir(), 'pywren_aws_lambda.zip')
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)  # Fixed timestamp of zip entries, for reproducible code hashes
+RUNTIME_META_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cloudbutton', 'cache', 'aws_lambda')
+RUNTIME_META_PREFIX = 'pywren.runtimes/aws_lambda'
 
 def load_config(config_data=None):
     if 'runtime_memory' not in config_data['pywren']:
@@ -43,7 +71,9 @@ def load_config(config_data=None):
     if 'runtime' not in config_data['pywren']:
         config_data['pywren']['runtime'] = 'python'+version_str(sys.version_info)
     if 'workers' not in config_data['pywren']:
-        config_data['pywren']['workers'] = MAX_CONCURRENT_WORKERS
+        # Sharded deployments add up the concurrency of every target
+        targets = config_data.get('aws_lambda', {}).get('targets') or [{}]
+        config_data['pywren']['workers'] = sum(t.get('concurrency', MAX_CONCURRENT_WORKERS) for t in targets)
 
     if 'aws' not in config_data and 'aws_lambda' not in config_data:
         raise Exception("'aws' and 'aws_lambda' sections are mandatory in the configuration")
@@ -51,10 +81,40 @@ def load_config(config_data=None):
     # Put credential keys to 'aws_lambda' dict entry
     config_data['aws_lambda'] = {**config_data['aws_lambda'], **config_data['aws']}
 
+    # Storage bucket is used to cache runtime metadata and to offload large payloads
+    if 'storage_bucket' in config_data['pywren']:
+        config_data['aws_lambda']['storage_bucket'] = config_data['pywren']['storage_bucket']
+
     required_parameters_0 = ('access_key_id', 'secret_access_key')
     if not set(required_parameters_0) <= set(config_data['aws']):
         raise Exception("'access_key_id' and 'secret_access_key' are mandatory under 'aws' section")
 
+    if 'invoke_pool_size' not in config_data['aws_lambda']:
+        config_data['aws_lambda']['invoke_pool_size'] = INVOKE_POOL_SIZE
+    if 'invoke_retries' not in config_data['aws_lambda']:
+        config_data['aws_lambda']['invoke_retries'] = INVOKE_RETRIES
+    if 'invoke_rate' not in config_data['aws_lambda']:
+        config_data['aws_lambda']['invoke_rate'] = INVOKE_RATE
+    if 'invoke_max_rate' not in config_data['aws_lambda']:
+        config_data['aws_lambda']['invoke_max_rate'] = INVOKE_MAX_RATE
+    if 'payload_compress_threshold' not in config_data['aws_lambda']:
+        config_data['aws_lambda']['payload_compress_threshold'] = PAYLOAD_COMPRESS_THRESHOLD
+    if 'payload_offload_threshold' not in config_data['aws_lambda']:
+        config_data['aws_lambda']['payload_offload_threshold'] = PAYLOAD_OFFLOAD_THRESHOLD
+    if 'store_timings' not in config_data['aws_lambda']:
+        config_data['aws_lambda']['store_timings'] = STORE_TIMINGS
+
+    if config_data['aws_lambda'].get('targets'):
+        for target in config_data['aws_lambda']['targets']:
+            if 'region_name' not in target:
+                raise Exception("'region_name' is mandatory in every 'targets' entry of the 'aws_lambda' section")
+            if 'concurrency' not in target:
+                target['concurrency'] = MAX_CONCURRENT_WORKERS
+        if 'shard_invoke_retries' not in config_data['aws_lambda']:
+            config_data['aws_lambda']['shard_invoke_retries'] = SHARD_INVOKE_RETRIES
+        if 'shard_slot_ttl' not in config_data['aws_lambda']:
+            config_data['aws_lambda']['shard_slot_ttl'] = SHARD_SLOT_TTL
+
     if 'execution_role' not in config_data['aws_lambda']:
         raise Exception("'execution_role' is mandatory under 'aws_lambda' section")
     
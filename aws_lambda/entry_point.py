@@ -14,26 +14,217 @@
 # limitations under the License.
 #
 
+import time
+IMPORT_START = time.time()
+
 import logging
 import os
+import sys
+import json
+import uuid
+import pkgutil
 from pywren_ibm_cloud.version import __version__
-from pywren_ibm_cloud.config import cloud_logging_config
+from pywren_ibm_cloud.config import cloud_logging_config, JOBS_PREFIX
 from pywren_ibm_cloud.function import function_handler
 from pywren_ibm_cloud.function import function_invoker
+from pywren_ibm_cloud.compute.backends.aws_lambda.payload import decode_payload, PayloadEncoder, \
+    PAYLOAD_FIELD, PART_FIELD
+from pywren_ibm_cloud.compute.backends.aws_lambda.tree_invoker import run_tree_node, store_failures, TREE_FIELD
+IMPORT_END = time.time()
 
 cloud_logging_config(logging.INFO)
 logger = logging.getLogger('__main__')
 
+# Module globals survive across warm invocations of the same container
+WARM_STATE = {
+    'container_id': uuid.uuid4().hex,
+    'cold': True,
+    'invocations': 0,
+    'executors': [],
+    'payload_parts': {}
+}
+
+
+def get_runtime_meta():
+    """
+    Extract preinstalled Python modules from this execution environment
+    return : runtime meta dictionary
+    """
+    runtime_meta = dict()
+    mods = list(pkgutil.iter_modules())
+    runtime_meta['preinstalls'] = [entry for entry in sorted([[mod, is_pkg] for _, mod, is_pkg in mods])]
+    python_version = sys.version_info
+    runtime_meta['python_ver'] = str(python_version[0])+"."+str(python_version[1])
+    return runtime_meta
+
+
+def prepare_warm_state(event):
+    """
+    Registers the immutable objects of this call (the function pickle) in the warm object
+    cache of the storage backend, so warm containers reuse them instead of downloading
+    them again for every call of the same executor
+    """
+    config = event.get('config', {})
+    if config.get('pywren', {}).get('storage_backend') != 'aws_s3' or 'func_key' not in event:
+        return
+    try:
+        from pywren_ibm_cloud.storage.backends.aws_s3.warm_cache import warm_objects
+    except ImportError:
+        return
+
+    executor_id = event['executor_id']
+    if executor_id not in WARM_STATE['executors']:
+        WARM_STATE['executors'].append(executor_id)
+    warm_objects.pin(executor_id, config['pywren']['storage_bucket'], event['func_key'])
+
+
+def warm_up(params):
+    """
+    No-op invocation used to start containers ahead of a map. The container is held
+    for a while so that concurrent warm-up requests land on different containers.
+    return : container state
+    """
+    state = {'container_id': WARM_STATE['container_id'],
+             'cold': WARM_STATE['cold'],
+             'invocations': WARM_STATE['invocations']}
+    WARM_STATE['cold'] = False
+    time.sleep(params.get('hold', 0))
+    return state
+
+
+def store_timing(event, timing):
+    """
+    Stores the timing record of a call next to its status object, if 'store_timings' is enabled
+    in the 'aws_lambda' config (one more S3 request per call). Otherwise it is only logged.
+    """
+    config = event.get('config', {})
+    storage_bucket = config.get('pywren', {}).get('storage_bucket')
+    if not config.get('aws_lambda', {}).get('store_timings') or storage_bucket is None:
+        logger.info("Timing: {}".format(json.dumps(timing)))
+        return
+    try:
+        timing_key = '/'.join([JOBS_PREFIX, event['executor_id'], event['job_id'], event['call_id'], 'timing.json'])
+        get_client('s3').put_object(Bucket=storage_bucket, Key=timing_key, Body=json.dumps(timing))
+    except Exception as e:
+        logger.info("Unable to store timing record: {}".format(e))
+
+
+def get_client(service, max_pool_connections=None):
+    """
+    Clients are shared by the whole container (and the storage backend), so warm invocations reuse them
+    :param max_pool_connections: minimum connection pool size (defaults to the client pool's CLIENT_POOL_SIZE)
+    """
+    from pywren_ibm_cloud.storage.backends.aws_s3.client_pool import client_pool
+    if max_pool_connections is None:
+        return client_pool.get_client(service)
+    return client_pool.get_client(service, max_pool_connections=max_pool_connections)
+
+
+def resolve_payload(event):
+    """
+    Resolves offloaded payloads and shared payload parts, and decompresses the payload
+    """
+    if PAYLOAD_FIELD not in event and not any(isinstance(v, dict) and PART_FIELD in v for v in event.values()):
+        return event
+    return decode_payload(event, get_client('s3'), WARM_STATE['payload_parts'])
+
+
+def tree_invoker(event):
+    """
+    Runs one node of a tree of invokers (see AWSLambdaBackend.invoke_tree).
+    Errors are logged and never raised: a failed asynchronous invocation would be retried
+    by Lambda, invoking again every worker the node had already dispatched.
+    """
+    try:
+        run_tree_invoker(resolve_payload(event)[TREE_FIELD])
+    except Exception as e:
+        logger.exception('Tree invoker node failed: {}'.format(e))
+
+
+def run_tree_invoker(node):
+    """
+    The calls the node could not invoke are stored in the storage bucket, to be invoked again by the client.
+    """
+    payload_config = node['payload_config']
+    storage_client = get_client('s3') if payload_config['bucket'] is not None else None
+    payload_encoder = PayloadEncoder(storage_client, payload_config['bucket'], JOBS_PREFIX,
+                                     payload_config['compress_threshold'],
+                                     payload_config['offload_threshold'],
+                                     payload_config['part_threshold'])
+    pool_size = node.get('invoke_config', {}).get('pool_size')
+    failed_calls = run_tree_node(node, get_client('lambda', pool_size), payload_encoder)
+    if not failed_calls:
+        return
+
+    call_ids = [call.get('call_id') for call in failed_calls]
+    if payload_config['bucket'] is None:
+        logger.error("Tree node failed to invoke calls {} ('storage_bucket' is not set, "
+                     "they can not be recorded)".format(call_ids))
+        return
+    failures_key = store_failures(get_client('s3'), payload_config['bucket'], JOBS_PREFIX, node, failed_calls)
+    logger.error('Tree node failed to invoke calls {} - Recorded in {}'.format(call_ids, failures_key))
+
 
 def main(event, context):
+    if 'get_preinstalls' in event:
+        logger.info("PyWren v{} - Generating metadata".format(__version__))
+        return get_runtime_meta()
+
+    if 'warm_up' in event:
+        return warm_up(event['warm_up'])
+
+    handler_start = time.time()
     logger.info("Starting AWS Lambda Function execution")
     os.environ['__PW_ACTIVATION_ID'] = context.aws_request_id
+    WARM_STATE['invocations'] += 1
+    logger.info("Container {} - {} start (invocation {})".format(WARM_STATE['container_id'],
+                'Cold' if WARM_STATE['cold'] else 'Warm', WARM_STATE['invocations']))
+
+    timing = {
+        'container_id': WARM_STATE['container_id'],
+        'cold': WARM_STATE['cold'],
+        'invocation': WARM_STATE['invocations'],
+        'memory': int(context.memory_limit_in_mb),
+        'import_start': IMPORT_START,
+        'import_end': IMPORT_END,
+        'import_time': IMPORT_END - IMPORT_START if WARM_STATE['cold'] else 0.0,
+        'init_time': handler_start - IMPORT_END if WARM_STATE['cold'] else 0.0,
+        'handler_start': handler_start,
+        'phases': {}
+    }
+    WARM_STATE['cold'] = False
+
+    def phase(name, start):
+        end = time.time()
+        timing['phases'][name] = end - start
+        return end
+
+    if TREE_FIELD in event:
+        logger.info("PyWren v{} - Starting tree invoker".format(__version__))
+        tree_invoker(event)
+        return
+
+    start = time.time()
+    event = resolve_payload(event)
+    phase('resolve', start)
+
     if 'remote_invoker' in event:
         logger.info("PyWren v{} - Starting invoker".format(__version__))
         function_invoker(event)
     else:
         logger.info("PyWren v{} - Starting execution".format(__version__))
-        function_handler(event)
+        start = time.time()
+        prepare_warm_state(event)
+        start = phase('prepare', start)
+        try:
+            function_handler(event)
+        finally:
+            phase('handler', start)
+            timing['handler_end'] = time.time()
+            timing['total_time'] = timing['handler_end'] - handler_start
+            if 'host_submit_tstamp' in event:
+                timing['host_submit_tstamp'] = event['host_submit_tstamp']
+            store_timing(event, timing)
 
     return {"Execution": "Finished"}
 
@@ -0,0 +1,144 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import zlib
+import base64
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_FIELD = '__pw_payload'
+PART_FIELD = '__pw_part'
+TREE_FIELD = 'tree_invoker'
+# Fields kept (as flags) on compressed/offloaded payloads, so the handler can route them before decoding
+ROUTING_FIELDS = (TREE_FIELD, )
+
+
+class PayloadEncoder:
+    """
+    Encodes invocation payloads so they fit the asynchronous invocation limit:
+     - large payload parts shared by many calls (e.g. 'config') are uploaded once to the
+       storage bucket and replaced by a reference to their key,
+     - payloads above 'compress_threshold' bytes are zlib-compressed if that makes them smaller,
+     - payloads still above 'offload_threshold' bytes are spilled to the storage bucket and
+       only a pointer is sent.
+    Objects are stored under the executor's job prefix, so they are cleaned up with the executor.
+    """
+
+    def __init__(self, storage_client, bucket, prefix, compress_threshold, offload_threshold,
+                 part_threshold, shared_parts=('config',)):
+        self.storage_client = storage_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.compress_threshold = compress_threshold
+        self.offload_threshold = offload_threshold
+        self.part_threshold = part_threshold
+        self.shared_parts = shared_parts
+        self._uploaded = set()
+        self._lock = threading.Lock()
+
+    def _put_once(self, key, data):
+        with self._lock:
+            if key in self._uploaded:
+                return
+        self.storage_client.put_object(Bucket=self.bucket, Key=key, Body=data)
+        with self._lock:
+            self._uploaded.add(key)
+
+    def _object_key(self, payload, name):
+        return '/'.join([self.prefix, payload.get('executor_id', 'shared'), 'payloads', name])
+
+    def share_parts(self, payload):
+        """
+        Replaces the large shared parts of a payload by references to their stored copy
+        return : payload dict
+        """
+        if self.bucket is None:
+            return payload
+        shared = {}
+        for part in self.shared_parts:
+            if part not in payload or (isinstance(payload[part], dict) and PART_FIELD in payload[part]):
+                continue
+            part_body = json.dumps(payload[part], sort_keys=True).encode()
+            if len(part_body) > self.part_threshold:
+                key = self._object_key(payload, hashlib.sha256(part_body).hexdigest()+'.json')
+                self._put_once(key, part_body)
+                shared[part] = {PART_FIELD: {'bucket': self.bucket, 'key': key}}
+        return {**payload, **shared} if shared else payload
+
+    def encode(self, payload):
+        """
+        return : JSON string to send as the invocation payload
+        """
+        payload = self.share_parts(payload)
+        body = json.dumps(payload)
+        if len(body) <= self.compress_threshold:
+            return body
+
+        compressed = zlib.compress(body.encode())
+        routing = {field: True for field in ROUTING_FIELDS if field in payload}
+        if len(compressed) * 4 / 3 < len(body):
+            encoded = json.dumps({PAYLOAD_FIELD: {'encoding': 'zlib+base64',
+                                                  'data': base64.b64encode(compressed).decode()},
+                                  **routing})
+            if len(encoded) <= self.offload_threshold:
+                return encoded
+        elif len(body) <= self.offload_threshold:
+            return body
+
+        if self.bucket is None:
+            raise Exception('Payload of {} bytes exceeds the invocation limit and no '
+                            'storage bucket is configured to offload it'.format(len(body)))
+        key = self._object_key(payload, hashlib.sha256(compressed).hexdigest()+'.zlib')
+        self._put_once(key, compressed)
+        logger.debug('Payload of {} bytes offloaded to {}'.format(len(body), key))
+        return json.dumps({PAYLOAD_FIELD: {'encoding': 'zlib', 'bucket': self.bucket, 'key': key},
+                           'executor_id': payload.get('executor_id'),
+                           'call_id': payload.get('call_id'),
+                           **routing})
+
+
+def decode_payload(event, storage_client, part_cache=None):
+    """
+    Resolves the pointers and decompresses the payloads produced by PayloadEncoder.
+    Shared parts are content-addressed, so they can be kept in 'part_cache' across calls.
+    return : original payload dict
+    """
+    if PAYLOAD_FIELD in event:
+        encoded = event[PAYLOAD_FIELD]
+        if encoded['encoding'] == 'zlib+base64':
+            compressed = base64.b64decode(encoded['data'])
+        else:
+            response = storage_client.get_object(Bucket=encoded['bucket'], Key=encoded['key'])
+            compressed = response['Body'].read()
+        event = json.loads(zlib.decompress(compressed).decode())
+
+    for part, value in list(event.items()):
+        if isinstance(value, dict) and PART_FIELD in value:
+            key = value[PART_FIELD]['key']
+            if part_cache is not None and key in part_cache:
+                part_body = part_cache[key]
+            else:
+                response = storage_client.get_object(Bucket=value[PART_FIELD]['bucket'], Key=key)
+                part_body = response['Body'].read()
+                if part_cache is not None:
+                    part_cache[key] = part_body
+            event[part] = json.loads(part_body)
+
+    return event
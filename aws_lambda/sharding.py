@@ -0,0 +1,328 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import time
+import random
+import logging
+import threading
+import botocore
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import pywren_ibm_cloud
+from . import config as aws_lambda_config
+from .aws_lambda import AWSLambdaBackend
+from .throttling import InvocationThrottledError
+
+logger = logging.getLogger(__name__)
+
+
+class WeightedShardScheduler:
+    """
+    Spreads invocations across shards (regions/accounts) in proportion to their weight:
+    free concurrency (capacity minus the invocations started in the last 'slot_ttl' seconds)
+    times a throttle factor, which is cut on every throttle and recovers with every success.
+    Asynchronous invocations do not report when they finish, so their concurrency slots
+    are released when they expire. The clock and random generator can be injected for tests.
+    """
+
+    def __init__(self, capacities, slot_ttl=aws_lambda_config.SHARD_SLOT_TTL,
+                 throttle_decrease=aws_lambda_config.SHARD_THROTTLE_DECREASE,
+                 throttle_recovery=aws_lambda_config.SHARD_THROTTLE_RECOVERY,
+                 clock=time.monotonic, rng=None):
+        self.capacities = dict(capacities)
+        self.slot_ttl = slot_ttl
+        self.throttle_decrease = throttle_decrease
+        self.throttle_recovery = throttle_recovery
+        self.clock = clock
+        self.random = rng or random.Random()
+        self._lock = threading.Lock()
+        self._slots = {shard: deque() for shard in self.capacities}
+        self._factors = {shard: 1.0 for shard in self.capacities}
+        self._counters = {shard: {'invocations': 0, 'throttles': 0, 'errors': 0} for shard in self.capacities}
+
+    def _expire(self, now):
+        for slots in self._slots.values():
+            while slots and now - slots[0] >= self.slot_ttl:
+                slots.popleft()
+
+    def _weight(self, shard):
+        free = max(0, self.capacities[shard] - len(self._slots[shard]))
+        return free * self._factors[shard]
+
+    def weights(self):
+        """
+        return : dict of {shard: current weight}
+        """
+        with self._lock:
+            self._expire(self.clock())
+            return {shard: self._weight(shard) for shard in self.capacities}
+
+    def select(self, exclude=()):
+        """
+        Picks the shard of the next invocation and takes one of its concurrency slots.
+        When every shard is saturated, the least throttled shard relative to its load is picked.
+        return : shard name, or None if every shard is excluded
+        """
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            shards = [shard for shard in self.capacities if shard not in exclude]
+            if not shards:
+                return None
+            weights = [self._weight(shard) for shard in shards]
+            total = sum(weights)
+            if total > 0:
+                point = self.random.uniform(0, total)
+                for candidate, weight in zip(shards, weights):
+                    if weight > 0:
+                        shard = candidate
+                        point -= weight
+                        if point <= 0:
+                            break
+            else:
+                shard = max(shards, key=lambda s: self._factors[s] * self.capacities[s] / (len(self._slots[s]) + 1))
+            self._slots[shard].append(now)
+            self._counters[shard]['invocations'] += 1
+            return shard
+
+    def release(self, shard):
+        """
+        Frees the newest slot of a shard, for an invocation that was not accepted
+        """
+        with self._lock:
+            if self._slots[shard]:
+                self._slots[shard].pop()
+
+    def on_success(self, shard):
+        with self._lock:
+            self._factors[shard] = min(1.0, self._factors[shard] + self.throttle_recovery)
+
+    def on_throttle(self, shard):
+        self.release(shard)
+        with self._lock:
+            self._counters[shard]['throttles'] += 1
+            self._factors[shard] = max(0.01, self._factors[shard] * self.throttle_decrease)
+
+    def on_error(self, shard):
+        self.release(shard)
+        with self._lock:
+            self._counters[shard]['errors'] += 1
+
+    def stats(self):
+        with self._lock:
+            self._expire(self.clock())
+            return {shard: {**self._counters[shard],
+                            'in_flight': len(self._slots[shard]),
+                            'capacity': self.capacities[shard],
+                            'throttle_factor': round(self._factors[shard], 3)}
+                    for shard in self.capacities}
+
+
+class ShardedLambdaBackend:
+    """
+    Compute backend that deploys the runtime to several targets (regions and/or accounts)
+    and spreads invocations across them with a WeightedShardScheduler, to go beyond the
+    concurrency limit of a single region. Every target is a regular AWSLambdaBackend;
+    an invocation that a target rejects (throttled, failed) is handed over to another one.
+    All targets share the same storage bucket, so a call reads and writes the same
+    storage location whichever region runs it.
+    """
+
+    def __init__(self, aws_lambda_config):
+        self.name = 'aws_lambda'
+        self.aws_lambda_config = aws_lambda_config
+        self.storage_bucket = aws_lambda_config.get('storage_bucket')
+        self.invoke_pool_size = aws_lambda_config['invoke_pool_size']
+        self.shards = {}
+        capacities = {}
+
+        base_config = {k: v for k, v in aws_lambda_config.items() if k != 'targets'}
+        for target in aws_lambda_config['targets']:
+            target_config = {**base_config, **target}
+            target_config['region'] = target_config['region_name']
+            target_config['storage_bucket'] = self.storage_bucket
+            # Throttled invocations are handed over to other targets rather than retried in place
+            target_config['invoke_retries'] = target.get('invoke_retries', aws_lambda_config['shard_invoke_retries'])
+            shard = target.get('name', target_config['region'])
+            if shard in self.shards:
+                raise Exception("Duplicated AWS Lambda target '{}': set a distinct 'name' for each target".format(shard))
+            self.shards[shard] = AWSLambdaBackend(target_config)
+            capacities[shard] = target_config['concurrency']
+
+        self.primary = self.shards[next(iter(self.shards))]
+        self.scheduler = WeightedShardScheduler(capacities, slot_ttl=aws_lambda_config['shard_slot_ttl'])
+        logger.info('Pywren v{} init for AWS Lambda - Sharded over {}'
+                    .format(pywren_ibm_cloud.__version__, ', '.join(self.shards)))
+
+    def _map_shards(self, func):
+        """
+        Runs func(shard_backend) on every shard concurrently
+        return : list of results, in shard order
+        """
+        with ThreadPoolExecutor(max_workers=len(self.shards)) as executor:
+            return list(executor.map(func, self.shards.values()))
+
+    def create_runtime(self, runtime_name, memory=3008, code=None, timeout=900):
+        """
+        Deploys the runtime to every target
+        return : runtime metadata of the first target
+        """
+        def create_runtime(backend):
+            return backend.create_runtime(runtime_name, memory, code, timeout)
+
+        return self._map_shards(create_runtime)[0]
+
+    def delete_runtime(self, runtime_name, memory):
+        def delete_runtime(backend):
+            return backend.delete_runtime(runtime_name, memory)
+
+        self._map_shards(delete_runtime)
+
+    def delete_all_runtimes(self):
+        def delete_all_runtimes(backend):
+            return backend.delete_all_runtimes()
+
+        self._map_shards(delete_all_runtimes)
+
+    def list_runtimes(self, docker_image_name='all'):
+        """
+        List the lambda runtimes deployed to every target.
+        return: Array of tuples (function_name, memory)
+        """
+        def list_runtimes(backend):
+            return backend.list_runtimes(docker_image_name)
+
+        runtimes = []
+        for shard_runtimes in self._map_shards(list_runtimes):
+            runtimes.extend(r for r in shard_runtimes if r not in runtimes)
+        return runtimes
+
+    def get_runtime_key(self, runtime_name, runtime_memory):
+        """
+        Runtime key shared by all the targets, so the runtime is deployed once for the whole set
+        """
+        action_name = self.primary._format_action_name(runtime_name, runtime_memory)
+        return os.path.join(self.name, 'sharded', '_'.join(sorted(self.shards)), action_name)
+
+    def _invoke(self, runtime_name, runtime_memory, payload):
+        """
+        Invokes the function on the shard picked by the scheduler, handing the invocation
+        over to another shard when it is throttled or fails on the server side
+        return : activation ID. InvocationThrottledError is raised if some target was throttled and
+                 none accepted the invocation, else the error of the last target
+        """
+        tried = []
+        throttled = False
+        last_error = None
+        while True:
+            shard = self.scheduler.select(exclude=tried)
+            if shard is None:
+                if throttled or last_error is None:
+                    raise InvocationThrottledError(self.primary._format_action_name(runtime_name, runtime_memory),
+                                                   len(tried))
+                raise last_error
+            tried.append(shard)
+            try:
+                activation_id = self.shards[shard]._invoke(runtime_name, runtime_memory, payload)
+                self.scheduler.on_success(shard)
+                return activation_id
+            except InvocationThrottledError:
+                self.scheduler.on_throttle(shard)
+                throttled = True
+            except botocore.exceptions.BotoCoreError as e:
+                self.scheduler.on_error(shard)
+                last_error = e
+            except botocore.exceptions.ClientError as e:
+                if e.response['ResponseMetadata'].get('HTTPStatusCode', 500) < 500:
+                    self.scheduler.release(shard)
+                    raise e
+                self.scheduler.on_error(shard)
+                last_error = e
+            logger.debug('ExecutorID {} - Function {} invocation failed on {}, {} targets left'
+                         .format(payload['executor_id'], payload['call_id'], shard,
+                                 len(self.shards) - len(tried)))
+
+    def invoke(self, runtime_name, runtime_memory, payload):
+        """
+        Invoke lambda function asynchronously on one of the targets
+        return : activation ID, or None if no target accepted the invocation and some target throttled it.
+                 Other errors (e.g. 5xx responses or network errors on every target) are raised
+        """
+        try:
+            return self._invoke(runtime_name, runtime_memory, payload)
+        except InvocationThrottledError:
+            return None
+
+    def invoke_batch(self, runtime_name, runtime_memory, payloads):
+        """
+        Invoke lambda function asynchronously once per payload, spread across the targets
+        return : list with the activation ID, or the exception raised, of each payload (in input order)
+        """
+        def invoke_one(payload):
+            try:
+                return self._invoke(runtime_name, runtime_memory, payload)
+            except Exception as e:
+                return e
+
+        payloads = list(payloads)
+        for backend in self.shards.values():
+            backend.rate_controller.reserve_retries(len(payloads))
+        max_workers = self.invoke_pool_size * len(self.shards)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(invoke_one, payloads))
+
+    def invocation_stats(self):
+        """
+        Returns the scheduler counters and the rate controller stats of every target
+        """
+        scheduler_stats = self.scheduler.stats()
+        return {shard: {**scheduler_stats[shard], 'rate_controller': backend.invocation_stats()}
+                for shard, backend in self.shards.items()}
+
+    def warm_up(self, runtime_name, runtime_memory, count, hold=aws_lambda_config.WARM_UP_HOLD):
+        """
+        Starts 'count' containers, split across the targets in proportion to their weight
+        return : dict of {shard: warm-up report}
+        """
+        weights = self.scheduler.weights()
+        if sum(weights.values()) == 0:
+            weights = {shard: 1 for shard in weights}
+        total = sum(weights.values())
+        counts = {shard: int(round(count * weights[shard] / total)) for shard in self.shards}
+
+        def warm_up(shard):
+            if counts[shard] == 0:
+                return None
+            return self.shards[shard].warm_up(runtime_name, runtime_memory, counts[shard], hold)
+
+        with ThreadPoolExecutor(max_workers=len(self.shards)) as executor:
+            return dict(zip(self.shards, executor.map(warm_up, self.shards)))
+
+    def invoke_with_result(self, runtime_name, runtime_memory, payload={}):
+        """
+        Invoke lambda function on the first target and wait for result
+        """
+        return self.primary.invoke_with_result(runtime_name, runtime_memory, payload)
+
+    def get_timings(self, executor_id, job_id=None):
+        """
+        Timing records are stored in the shared storage bucket, see AWSLambdaBackend.get_timings()
+        """
+        return self.primary.get_timings(executor_id, job_id)
+
+    def get_timing_summary(self, executor_id, job_id=None, percentiles=(50, 90, 99)):
+        return self.primary.get_timing_summary(executor_id, job_id, percentiles)
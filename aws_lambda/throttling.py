@@ -0,0 +1,170 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+import random
+import threading
+
+
+class InvocationThrottledError(Exception):
+    """
+    Raised when an invocation is still throttled after its retries are spent
+    """
+    def __init__(self, function_name, attempts):
+        msg = 'Function {} invocation throttled after {} attempts'.format(function_name, attempts)
+        super(InvocationThrottledError, self).__init__(msg)
+        self.function_name = function_name
+        self.attempts = attempts
+
+
+class InvocationRateController:
+    """
+    AIMD token bucket that paces function invocations.
+    While invocations succeed, the allowed rate grows additively ('additive_increase'
+    invocations/s at most once per congestion window). Throttles and network errors cut it
+    multiplicatively, also at most once per congestion window (the larger of 'decrease_window'
+    and the smoothed request round-trip time), so a burst of concurrent 429 responses counts
+    as a single congestion event. Retries draw from a shared budget that is refilled by successful
+    invocations and sized to every dispatched batch (see reserve_retries()), so a
+    throttled account is not flooded with retries.
+    """
+
+    def __init__(self, initial_rate=500, min_rate=1, max_rate=5000, additive_increase=10,
+                 multiplicative_decrease=0.5, decrease_window=0.1, backoff_base=0.1, backoff_max=10,
+                 retry_budget=100, retry_ratio=0.2, clock=time.monotonic):
+        self.rate = float(initial_rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.additive_increase = additive_increase
+        self.multiplicative_decrease = multiplicative_decrease
+        self.decrease_window = decrease_window
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_budget_max = float(retry_budget)
+        self.retry_ratio = retry_ratio
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._tokens = 1.0
+        self._retry_tokens = float(retry_budget)
+        self._last_refill = clock()
+        self._last_increase = None
+        self._last_decrease = None
+        self._rtt = None
+
+        self.invocations = 0
+        self.successes = 0
+        self.throttles = 0
+        self.errors = 0
+        self.retries = 0
+
+    def acquire(self):
+        """
+        Blocks until the current rate allows one more invocation
+        """
+        while True:
+            with self._lock:
+                now = self.clock()
+                # Allow bursts of up to one second worth of invocations
+                self._tokens = min(self.rate, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.invocations += 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def _observe_rtt(self, rtt):
+        if rtt is not None:
+            self._rtt = rtt if self._rtt is None else 0.875 * self._rtt + 0.125 * rtt
+
+    def on_success(self, rtt=None):
+        with self._lock:
+            self.successes += 1
+            self._observe_rtt(rtt)
+            self._increase()
+            self._retry_tokens = min(self.retry_budget_max, self._retry_tokens + self.retry_ratio)
+
+    def on_throttle(self, rtt=None):
+        with self._lock:
+            self.throttles += 1
+            self._observe_rtt(rtt)
+            self._decrease()
+
+    def on_error(self, rtt=None):
+        with self._lock:
+            self.errors += 1
+            self._observe_rtt(rtt)
+            self._decrease()
+
+    def congestion_window(self):
+        """
+        Minimum time (s) between two rate increases, or two rate decreases
+        """
+        return max(self.decrease_window, self._rtt or 0)
+
+    def _increase(self):
+        # Successes within the same congestion window only count once
+        now = self.clock()
+        if self._last_increase is None or now - self._last_increase >= self.congestion_window():
+            self.rate = min(self.max_rate, self.rate + self.additive_increase)
+            self._last_increase = now
+
+    def _decrease(self):
+        # Requests throttled within the same congestion window only count once
+        now = self.clock()
+        if self._last_decrease is None or now - self._last_decrease >= self.congestion_window():
+            self.rate = max(self.min_rate, self.rate * self.multiplicative_decrease)
+            self._tokens = min(self._tokens, 0)
+            self._last_decrease = now
+
+    def reserve_retries(self, count):
+        """
+        Sizes the retry budget to a batch of 'count' invocations about to be dispatched,
+        so every call of the batch can be retried even if the account throttles throughout
+        """
+        with self._lock:
+            self.retry_budget_max = max(self.retry_budget_max, float(count))
+            self._retry_tokens = max(self._retry_tokens, float(count))
+
+    def acquire_retry(self):
+        """
+        Takes one token from the retry budget
+        return : True if the retry is allowed, else False
+        """
+        with self._lock:
+            if self._retry_tokens < 1:
+                return False
+            self._retry_tokens -= 1
+            self.retries += 1
+            return True
+
+    def backoff(self, attempt):
+        """
+        Returns the time to wait before the given retry attempt (exponential backoff with full jitter)
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def stats(self):
+        with self._lock:
+            return {'rate': round(self.rate, 2),
+                    'invocations': self.invocations,
+                    'successes': self.successes,
+                    'throttles': self.throttles,
+                    'errors': self.errors,
+                    'retries': self.retries,
+                    'retry_budget': int(self._retry_tokens)}
@@ -0,0 +1,65 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import math
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of a list of values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def _timing_metrics(timing):
+    """
+    Flattens one timing record (as stored by the entry point) into {metric: seconds}
+    """
+    metrics = {'import_time': timing['import_time'],
+               'init_time': timing['init_time'],
+               'total_time': timing['total_time']}
+    for name, duration in timing['phases'].items():
+        metrics[name+'_time'] = duration
+    if 'host_submit_tstamp' in timing:
+        metrics['start_delay'] = timing['handler_start'] - timing['host_submit_tstamp']
+    return metrics
+
+
+def aggregate_timings(timings, percentiles=(50, 90, 99)):
+    """
+    Summarizes the timing records of many calls
+    return : {'calls': n, 'cold_starts': n, 'metrics': {metric: {'min', 'p50', ..., 'max', 'mean'}}}
+    """
+    values = {}
+    for timing in timings:
+        for metric, value in _timing_metrics(timing).items():
+            values.setdefault(metric, []).append(value)
+
+    summary = {'calls': len(timings),
+               'cold_starts': sum(1 for timing in timings if timing['cold']),
+               'containers': len(set(timing['container_id'] for timing in timings)),
+               'metrics': {}}
+    for metric, metric_values in values.items():
+        stats = {'min': min(metric_values), 'max': max(metric_values),
+                 'mean': sum(metric_values) / len(metric_values)}
+        for pct in percentiles:
+            stats['p{}'.format(pct)] = percentile(metric_values, pct)
+        summary['metrics'][metric] = stats
+    return summary
@@ -0,0 +1,168 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+import json
+import logging
+import botocore
+from concurrent.futures import ThreadPoolExecutor
+from . import config as aws_lambda_config
+from .throttling import InvocationRateController
+from .payload import TREE_FIELD
+
+logger = logging.getLogger(__name__)
+
+FAILURES_DIR = 'tree_failures'
+
+
+def split_payloads(payloads):
+    """
+    Splits a list of payloads in the fields shared by all of them (template)
+    and the per-call fields (e.g. 'call_id', 'data_byte_range')
+    return : (template, calls)
+    """
+    template = dict(payloads[0])
+    for payload in payloads[1:]:
+        for field in list(template):
+            if field not in payload or payload[field] != template[field]:
+                del template[field]
+    calls = [{k: v for k, v in payload.items() if k not in template} for payload in payloads]
+    return template, calls
+
+
+def split_calls(calls, parts):
+    """
+    Splits a list of calls in at most 'parts' contiguous slices of (almost) equal size
+    """
+    parts = max(1, min(parts, len(calls)))
+    size, extra = divmod(len(calls), parts)
+    slices, start = [], 0
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        slices.append(calls[start:end])
+        start = end
+    return slices
+
+
+def build_tree_nodes(function_name, template, calls, branching_factor, leaf_size, max_depth,
+                     payload_config, invoke_config):
+    """
+    Builds the events of the first level of the invocation tree
+    :param invoke_config: dict with the 'pool_size', 'retries', 'rate' and 'max_rate' of the nodes' invocations
+    return : list of tree node events
+    """
+    return [{TREE_FIELD: {'function_name': function_name,
+                          'template': template,
+                          'calls': calls_slice,
+                          'branching_factor': branching_factor,
+                          'leaf_size': leaf_size,
+                          'depth': 1,
+                          'max_depth': max_depth,
+                          'payload_config': payload_config,
+                          'invoke_config': invoke_config},
+             'executor_id': template.get('executor_id'),
+             'call_id': '{}-{}'.format(calls_slice[0].get('call_id'), calls_slice[-1].get('call_id'))}
+            for calls_slice in split_calls(calls, branching_factor)]
+
+
+def invoke_event(lambda_client, function_name, body, rate_controller, retries):
+    """
+    Sends one asynchronous invocation, retrying throttles and transient errors with backoff
+    return : True if the invocation was accepted
+    """
+    for attempt in range(retries + 1):
+        rate_controller.acquire()
+        try:
+            lambda_client.invoke(FunctionName=function_name, InvocationType='Event', Payload=body)
+            rate_controller.on_success()
+            return True
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == 'TooManyRequestsException':
+                rate_controller.on_throttle()
+            elif e.response['ResponseMetadata'].get('HTTPStatusCode', 500) >= 500:
+                rate_controller.on_error()
+            else:
+                logger.error('Function {} invocation failed: {}'.format(function_name, e))
+                return False
+        except botocore.exceptions.BotoCoreError:
+            rate_controller.on_error()
+        if attempt < retries and rate_controller.acquire_retry():
+            time.sleep(rate_controller.backoff(attempt))
+        else:
+            break
+    logger.error('Function {} invocation failed after {} attempts'.format(function_name, attempt + 1))
+    return False
+
+
+def run_tree_node(node, lambda_client, payload_encoder):
+    """
+    Runs one node of the invocation tree: inner nodes split their calls in 'branching_factor'
+    slices and invoke one child node per slice, leaves invoke the worker of every call.
+    The invocations are paced with the pool size, retries and rates of the node's 'invoke_config'.
+    return : list of the calls that were not invoked (all the calls of a failed child node)
+    """
+    function_name = node['function_name']
+    calls = node['calls']
+    invoke_config = node.get('invoke_config', {})
+    pool_size = invoke_config.get('pool_size', aws_lambda_config.INVOKE_POOL_SIZE)
+    retries = invoke_config.get('retries', aws_lambda_config.INVOKE_RETRIES)
+    rate_controller = InvocationRateController(initial_rate=invoke_config.get('rate', aws_lambda_config.INVOKE_RATE),
+                                               max_rate=invoke_config.get('max_rate', aws_lambda_config.INVOKE_MAX_RATE))
+
+    if len(calls) <= node['leaf_size'] or node['depth'] >= node['max_depth']:
+        logger.info('Tree node (depth {}) invoking {} workers'.format(node['depth'], len(calls)))
+        bodies = [payload_encoder.encode({**node['template'], **call}) for call in calls]
+        call_groups = [[call] for call in calls]
+    else:
+        logger.info('Tree node (depth {}) splitting {} calls'.format(node['depth'], len(calls)))
+        children = []
+        call_groups = split_calls(calls, node['branching_factor'])
+        for calls_slice in call_groups:
+            child = {TREE_FIELD: {**node, 'calls': calls_slice, 'depth': node['depth'] + 1},
+                     'executor_id': node['template'].get('executor_id'),
+                     'call_id': '{}-{}'.format(calls_slice[0].get('call_id'), calls_slice[-1].get('call_id'))}
+            children.append(child)
+        bodies = [payload_encoder.encode(child) for child in children]
+
+    def invoke_one(body):
+        return invoke_event(lambda_client, function_name, body, rate_controller, retries)
+
+    rate_controller.reserve_retries(len(bodies))
+    with ThreadPoolExecutor(max_workers=max(1, min(pool_size, len(bodies)))) as executor:
+        results = list(executor.map(invoke_one, bodies))
+
+    failed_calls = [call for accepted, group in zip(results, call_groups) if not accepted for call in group]
+    logger.info('Tree node (depth {}) done - {} invocations - {} failed - {}'
+                .format(node['depth'], len(results), results.count(False), rate_controller.stats()))
+    return failed_calls
+
+
+def failures_prefix(jobs_prefix, executor_id, job_id):
+    return '/'.join([jobs_prefix, executor_id, job_id, FAILURES_DIR]) + '/'
+
+
+def store_failures(storage_client, bucket_name, jobs_prefix, node, failed_calls):
+    """
+    Stores the calls a tree node could not invoke under the prefix of their job, one
+    object per node, so the client can invoke them again (see AWSLambdaBackend.reinvoke_tree_failures)
+    return : key of the failures object
+    """
+    template = node['template']
+    first, last = node['calls'][0].get('call_id'), node['calls'][-1].get('call_id')
+    key = '{}{}-{}.json'.format(failures_prefix(jobs_prefix, template['executor_id'], template['job_id']), first, last)
+    storage_client.put_object(Bucket=bucket_name, Key=key,
+                              Body=json.dumps({'template': template, 'calls': failed_calls}))
+    return key
@@ -1 +1,2 @@
 from .aws_s3 import S3Backend as StorageBackend
+from .aws_s3_async import AsyncS3Backend
@@ -14,11 +14,22 @@
 # limitations under the License.
 #
 
+import io
+import time
+import queue
+import random
 import logging
-import boto3
+import threading
 import botocore
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from ..utils import StorageNoSuchKeyError
+from . import config as aws_s3_config
+from .warm_cache import warm_objects
+from .client_pool import client_pool
+from .cache import get_disk_cache
+from .reader import S3RangeReader
+from .partitioner import partition_object, partition_prefix
 
 logging.getLogger('boto3').setLevel(logging.CRITICAL)
 logging.getLogger('botocore').setLevel(logging.CRITICAL)
@@ -26,6 +37,36 @@ logging.getLogger('urllib3').setLevel(logging.CRITICAL)
 logger = logging.getLogger(__name__)
 
 
+def _bounded_map(func, items, max_workers):
+    """
+    Apply func to every item on a thread pool, with at most 'max_workers' calls in flight.
+    Yields (item, result) tuples as calls finish; exceptions raised by func are yielded as results.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+        for item in items:
+            in_flight[executor.submit(func, item)] = item
+            if len(in_flight) >= max_workers:
+                break
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                error = future.exception()
+                yield item, error if error is not None else future.result()
+                for next_item in items:
+                    in_flight[executor.submit(func, next_item)] = next_item
+                    break
+
+
+def _backoff(attempt):
+    """
+    return : jittered exponential delay (s) before retrying a request that failed 'attempt' times
+    """
+    return random.uniform(0, min(aws_s3_config.RETRY_BACKOFF_MAX, aws_s3_config.RETRY_BACKOFF_BASE * 2 ** attempt))
+
+
 class S3Backend:
     def __init__(self, s3_config, bucket=None, executor_id=None):
         service_endpoint = s3_config.get('endpoint').replace('http:', 'https:')
@@ -34,15 +75,33 @@ class S3Backend:
 
         logger.debug("AWS S3 using access_key_id and secret_access_key")
 
-        client_config = botocore.client.Config(max_pool_connections=128,
-                                               user_agent_extra='cloudbutton',
-                                               connect_timeout=1)
+        # Clients are shared by every backend of the process (e.g. across executors and warm invocations)
+        self.s3_client = client_pool.get_client('s3',
+                                                endpoint_url=service_endpoint,
+                                                access_key_id=s3_config['access_key_id'],
+                                                secret_access_key=s3_config['secret_access_key'],
+                                                max_pool_connections=s3_config.get('max_pool_connections',
+                                                                                   aws_s3_config.CLIENT_POOL_SIZE),
+                                                connect_timeout=1)
+
+        self.multipart_threshold = s3_config.get('multipart_threshold', aws_s3_config.MULTIPART_THRESHOLD)
+        self.multipart_chunksize = max(s3_config.get('multipart_chunksize', aws_s3_config.MULTIPART_CHUNKSIZE),
+                                       aws_s3_config.MULTIPART_MIN_CHUNKSIZE)
+        self.parallel_get = s3_config.get('parallel_get', False)
+        self.range_get_chunksize = s3_config.get('range_get_chunksize', aws_s3_config.RANGE_GET_CHUNKSIZE)
+        self.max_concurrency = s3_config.get('max_concurrency', aws_s3_config.MAX_CONCURRENCY)
+        # Every request is attempted at least once, whatever 'max_retries' says
+        self.max_retries = max(1, s3_config.get('max_retries', aws_s3_config.MAX_RETRIES))
+        self.bulk_max_concurrency = s3_config.get('bulk_max_concurrency', aws_s3_config.BULK_MAX_CONCURRENCY)
+        self.reader_blocksize = s3_config.get('reader_blocksize', aws_s3_config.READER_BLOCKSIZE)
+        self.reader_readahead = s3_config.get('reader_readahead', aws_s3_config.READER_READAHEAD)
 
-        self.s3_client = boto3.client('s3',
-                                      aws_access_key_id=s3_config['access_key_id'],
-                                      aws_secret_access_key=s3_config['secret_access_key'],
-                                      config=client_config,
-                                      endpoint_url=service_endpoint)
+        self.cache = None
+        self.cache_ttl = s3_config.get('cache_ttl', aws_s3_config.CACHE_TTL)
+        if s3_config.get('cache', False):
+            self.cache = get_disk_cache(s3_config.get('cache_dir', aws_s3_config.CACHE_DIR),
+                                        s3_config.get('cache_size', aws_s3_config.CACHE_MAX_BYTES),
+                                        self.cache_ttl)
 
     def get_client(self):
         """
@@ -59,6 +118,13 @@ class S3Backend:
         :type data: str/bytes
         :return: None
         """
+        if isinstance(data, str):
+            data = data.encode()
+        if self.cache is not None:
+            self.cache.discard(bucket_name, key)
+        if isinstance(data, (bytes, bytearray, memoryview)) and len(data) > self.multipart_threshold:
+            return self._multipart_upload(bucket_name, key, data)
+
         try:
             res = self.s3_client.put_object(
                 Bucket=bucket_name, Key=key, Body=data)
@@ -74,13 +140,86 @@ class S3Backend:
             else:
                 raise e
 
+    def _multipart_upload(self, bucket_name, key, data):
+        """
+        Upload an object in parts using a bounded thread pool. Each part is
+        retried on its own, and the upload is aborted if any part fails.
+        :param key: key of the object.
+        :param data: data of the object
+        :type data: bytes/bytearray/memoryview
+        :return: None
+        """
+        size = len(data)
+        chunksize = self.multipart_chunksize
+        if size > chunksize * aws_s3_config.MULTIPART_MAX_PARTS:
+            chunksize = -(-size // aws_s3_config.MULTIPART_MAX_PARTS)
+        view = memoryview(data)
+
+        def upload_part(part_number):
+            start = (part_number - 1) * chunksize
+            body = view[start:start+chunksize].tobytes()
+            for attempt in range(1, self.max_retries + 1):
+                try:
+                    res = self.s3_client.upload_part(Bucket=bucket_name, Key=key, UploadId=upload_id,
+                                                     PartNumber=part_number, Body=body)
+                    return {'PartNumber': part_number, 'ETag': res['ETag']}
+                except Exception as e:
+                    logger.debug('PUT Object {} - Part {} failed (attempt {}/{}): {}'
+                                 .format(key, part_number, attempt, self.max_retries, e))
+                    if attempt == self.max_retries:
+                        raise e
+                    time.sleep(_backoff(attempt))
+
+        try:
+            res = self.s3_client.create_multipart_upload(Bucket=bucket_name, Key=key)
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == "NoSuchKey":
+                raise StorageNoSuchKeyError(bucket_name, key)
+            else:
+                raise e
+        upload_id = res['UploadId']
+
+        try:
+            part_numbers = range(1, -(-size // chunksize) + 1)
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                parts = list(executor.map(upload_part, part_numbers))
+            self.s3_client.complete_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id,
+                                                     MultipartUpload={'Parts': parts})
+            logger.debug('PUT Object {} - Size: {} - {} parts - OK'.format(key, size, len(parts)))
+        except Exception as e:
+            logger.debug('PUT Object {} - Aborting multipart upload: {}'.format(key, e))
+            try:
+                self.s3_client.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id)
+            except Exception as abort_error:
+                logger.debug('PUT Object {} - Unable to abort multipart upload {}: {}'
+                             .format(key, upload_id, abort_error))
+            raise e
+
     def get_object(self, bucket_name, key, stream=False, extra_get_args={}):
         """
         Get object from COS with a key. Throws StorageNoSuchKeyError if the given key does not exist.
+        When 'parallel_get' is enabled, whole-object reads are split in concurrent byte-range requests.
+        When the disk cache is enabled, whole-object reads are served from it (see also get_object_mmap()).
         :param key: key of the object
         :return: Data of the object
         :rtype: str/bytes
         """
+        pinned = not stream and not extra_get_args and warm_objects.is_pinned(bucket_name, key)
+        if pinned:
+            data = warm_objects.get(bucket_name, key)
+            if data is not None:
+                logger.debug('GET Object {} - Served from warm cache'.format(key))
+                return data
+
+        if self.cache is not None and not stream and not extra_get_args:
+            return self._cached_get(bucket_name, key)
+
+        if self.parallel_get and not stream and 'Range' not in extra_get_args:
+            data = self._parallel_get(bucket_name, key, extra_get_args)
+            if pinned:
+                warm_objects.put(bucket_name, key, data)
+            return data
+
         try:
             r = self.s3_client.get_object(
                 Bucket=bucket_name, Key=key, **extra_get_args)
@@ -88,6 +227,8 @@ class S3Backend:
                 data = r['Body']
             else:
                 data = r['Body'].read()
+                if pinned:
+                    warm_objects.put(bucket_name, key, data)
             return data
         except botocore.exceptions.ClientError as e:
             if e.response['Error']['Code'] == "NoSuchKey":
@@ -95,6 +236,203 @@ class S3Backend:
             else:
                 raise e
 
+    def get_object_mmap(self, bucket_name, key):
+        """
+        Get a whole object through the disk cache, without copying it into the Python heap.
+        Throws StorageNoSuchKeyError if the given key does not exist.
+        :param key: key of the object
+        :return: Read-only memory map of the cached object (bytes if it was just downloaded
+                 or can not be cached)
+        :rtype: mmap/bytes
+        """
+        if self.cache is None:
+            raise Exception("get_object_mmap() requires the disk cache: set 'cache: True' in the aws_s3 config")
+        return self._cached_get(bucket_name, key, memory_map=True)
+
+    def _cached_get(self, bucket_name, key, memory_map=False):
+        """
+        Get an object through the disk cache. Cached entries are trusted within the cache TTL,
+        and revalidated with a conditional (If-None-Match) request afterwards.
+        :param key: key of the object
+        :param memory_map: return cached objects as read-only memory maps
+        :return: Data of the object
+        :rtype: bytes/mmap
+        """
+        entry = self.cache.lookup(bucket_name, key)
+        get_args = {}
+        if entry is not None:
+            if self.cache.is_fresh(entry, self.cache_ttl):
+                data = self.cache.read(entry, memory_map=memory_map)
+                if data is not None:
+                    logger.debug('GET Object {} - Served from disk cache'.format(key))
+                    return data
+            else:
+                get_args['IfNoneMatch'] = entry['etag']
+
+        try:
+            r = self.s3_client.get_object(Bucket=bucket_name, Key=key, **get_args)
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('304', 'NotModified'):
+                self.cache.refresh(entry)
+                data = self.cache.read(entry, revalidated=True, memory_map=memory_map)
+                if data is not None:
+                    logger.debug('GET Object {} - Revalidated disk cache entry'.format(key))
+                    return data
+                # The entry vanished from disk and was discarded: download it again
+                return self._cached_get(bucket_name, key, memory_map)
+            if e.response['Error']['Code'] == "NoSuchKey":
+                self.cache.discard(bucket_name, key)
+                raise StorageNoSuchKeyError(bucket_name, key)
+            else:
+                raise e
+
+        data = r['Body'].read()
+        self.cache.put(bucket_name, key, r.get('ETag'), data)
+        return data
+
+    def cache_stats(self):
+        """
+        :return: hit/miss/byte counters of the disk cache, or None if it is not enabled
+        :rtype: dict
+        """
+        return self.cache.stats() if self.cache is not None else None
+
+    def _parallel_get(self, bucket_name, key, extra_get_args={}):
+        """
+        Download an object with concurrent byte-range GETs. Every range is written
+        straight into a single preallocated buffer, so no intermediate copies are joined.
+        :param key: key of the object
+        :return: Data of the object
+        :rtype: bytes/bytearray
+        """
+        extra_head_args = {k: v for k, v in extra_get_args.items() if k in ('VersionId', 'IfMatch')}
+        try:
+            metadata = self.s3_client.head_object(Bucket=bucket_name, Key=key, **extra_head_args)
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == '404':
+                raise StorageNoSuchKeyError(bucket_name, key)
+            else:
+                raise e
+
+        size = metadata['ContentLength']
+        chunksize = self.range_get_chunksize
+        if size <= chunksize:
+            try:
+                r = self.s3_client.get_object(Bucket=bucket_name, Key=key, **extra_get_args)
+                return r['Body'].read()
+            except botocore.exceptions.ClientError as e:
+                if e.response['Error']['Code'] == "NoSuchKey":
+                    raise StorageNoSuchKeyError(bucket_name, key)
+                else:
+                    raise e
+
+        # Pin every range to the version we just inspected
+        get_args = {'IfMatch': metadata['ETag'], **extra_get_args}
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+
+        def get_range(start):
+            end = min(start + chunksize, size) - 1
+            for attempt in range(1, self.max_retries + 1):
+                try:
+                    r = self.s3_client.get_object(Bucket=bucket_name, Key=key,
+                                                  Range='bytes={}-{}'.format(start, end), **get_args)
+                    offset = start
+                    for chunk in r['Body'].iter_chunks(aws_s3_config.READ_BLOCKSIZE):
+                        view[offset:offset+len(chunk)] = chunk
+                        offset += len(chunk)
+                    if offset != end + 1:
+                        raise Exception('Incomplete read: got {} of {} bytes'.format(offset - start, end - start + 1))
+                    return
+                except botocore.exceptions.ClientError as e:
+                    if e.response['Error']['Code'] in ('NoSuchKey', 'PreconditionFailed'):
+                        raise e
+                    last_error = e
+                except Exception as e:
+                    last_error = e
+                logger.debug('GET Object {} - Range {}-{} failed (attempt {}/{}): {}'
+                             .format(key, start, end, attempt, self.max_retries, last_error))
+                if attempt < self.max_retries:
+                    time.sleep(_backoff(attempt))
+            raise last_error
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                list(executor.map(get_range, range(0, size, chunksize)))
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == "NoSuchKey":
+                raise StorageNoSuchKeyError(bucket_name, key)
+            else:
+                raise e
+        logger.debug('GET Object {} - Size: {} - {} ranges - OK'.format(key, size, -(-size // chunksize)))
+
+        return buffer
+
+    def open_object(self, bucket_name, key, block_size=None, readahead=None):
+        """
+        Open an object as a seekable, buffered binary file. Reads are served with byte-range
+        requests, and sequential reads prefetch the next blocks in the background.
+        Throws StorageNoSuchKeyError if the given key does not exist.
+        :param key: key of the object
+        :param block_size: size of the byte-range requests (defaults to 'reader_blocksize')
+        :param readahead: number of blocks prefetched (defaults to 'reader_readahead')
+        :return: file-like object
+        :rtype: io.BufferedReader
+        """
+        block_size = block_size or self.reader_blocksize
+        readahead = self.reader_readahead if readahead is None else readahead
+        raw = S3RangeReader(self.s3_client, bucket_name, key, block_size, readahead, self.max_retries)
+        return io.BufferedReader(raw, buffer_size=block_size)
+
+    def partition_object(self, bucket_name, key, chunk_size=aws_s3_config.PARTITION_CHUNKSIZE,
+                         num_chunks=None, delimiter=b'\n'):
+        """
+        Split an object in byte ranges of about 'chunk_size' bytes (or in 'num_chunks' ranges), aligned to
+        the end of a record delimiter. Workers read each range with get_object(extra_get_args=r.get_args()).
+        :param key: key of the object
+        :param delimiter: record delimiter
+        :return: list of ByteRange
+        """
+        return partition_object(self, bucket_name, key, chunk_size, num_chunks, delimiter,
+                                max_concurrency=self.bulk_max_concurrency)
+
+    def partition_prefix(self, bucket_name, prefix, chunk_size=aws_s3_config.PARTITION_CHUNKSIZE, delimiter=b'\n'):
+        """
+        Split every object under a prefix in record-aligned byte ranges of about 'chunk_size' bytes.
+        :param prefix: prefix of the objects
+        :param delimiter: record delimiter
+        :return: list of ByteRange
+        """
+        return partition_prefix(self, bucket_name, prefix, chunk_size, delimiter,
+                                max_concurrency=self.bulk_max_concurrency)
+
+    def get_objects(self, bucket_name, keys, max_concurrency=None):
+        """
+        Get many objects concurrently. Results are yielded as soon as each request finishes.
+        A missing key does not abort the batch: its result is a StorageNoSuchKeyError instance.
+        :param keys: keys of the objects
+        :param max_concurrency: max. number of requests in flight (defaults to 'bulk_max_concurrency')
+        :return: Generator of (key, data) tuples, where data is the exception raised for failed keys
+        :rtype: generator of tuple
+        """
+        def get_object(key):
+            return self.get_object(bucket_name, key)
+
+        return _bounded_map(get_object, keys, max_concurrency or self.bulk_max_concurrency)
+
+    def put_objects(self, bucket_name, objects, max_concurrency=None):
+        """
+        Put many objects concurrently, and wait until every request finishes.
+        :param objects: dict of {key: data}
+        :param max_concurrency: max. number of requests in flight (defaults to 'bulk_max_concurrency')
+        :return: List of (key, error) tuples, in completion order, where error is None for the keys stored successfully
+        :rtype: list of tuple
+        """
+        def put_object(key):
+            return self.put_object(bucket_name, key, objects[key])
+
+        return list(_bounded_map(put_object, objects, max_concurrency or self.bulk_max_concurrency))
+
     def head_object(self, bucket_name, key):
         """
         Head object from COS with a key. Throws StorageNoSuchKeyError if the given key does not exist.
@@ -117,22 +455,69 @@ class S3Backend:
         :param bucket: bucket name
         :param key: data key
         """
+        if self.cache is not None:
+            self.cache.discard(bucket_name, key)
         return self.s3_client.delete_object(Bucket=bucket_name, Key=key)
 
-    def delete_objects(self, bucket_name, key_list):
+    def delete_objects(self, bucket_name, key_list, quiet=True):
         """
-        Delete a list of objects from storage.
+        Delete a list of objects from storage. Batches of up to 1000 keys are sent concurrently,
+        and the keys that fail with a transient error are retried on their own.
         :param bucket: bucket name
         :param key_list: list of keys
+        :param quiet: use quiet mode, so that responses only carry the keys that failed
+        :return: dict with the 'Deleted' keys and the 'Errors' ({'Key', 'Code', 'Message'}) of the failed keys
         """
-        result = []
         max_keys_num = 1000
-        for i in range(0, len(key_list), max_keys_num):
-            delete_keys = {'Objects': []}
-            delete_keys['Objects'] = [{'Key': k}
-                                      for k in key_list[i:i+max_keys_num]]
-            result.append(self.s3_client.delete_objects(
-                Bucket=bucket_name, Delete=delete_keys))
+        if self.cache is not None:
+            for key in key_list:
+                self.cache.discard(bucket_name, key)
+
+        def delete_batch(keys):
+            delete_keys = {'Objects': [{'Key': k} for k in keys], 'Quiet': quiet}
+            try:
+                res = self.s3_client.delete_objects(Bucket=bucket_name, Delete=delete_keys)
+            except botocore.exceptions.ClientError as e:
+                code = e.response['Error']['Code']
+                if e.response['ResponseMetadata'].get('HTTPStatusCode', 500) >= 500:
+                    code = 'InternalError'
+                return [], [{'Key': k, 'Code': code, 'Message': e.response['Error'].get('Message', '')}
+                            for k in keys]
+            except botocore.exceptions.BotoCoreError as e:
+                return [], [{'Key': k, 'Code': 'RequestError', 'Message': str(e)} for k in keys]
+
+            errors = res.get('Errors', [])
+            if quiet:
+                failed = set(error['Key'] for error in errors)
+                deleted = [k for k in keys if k not in failed]
+            else:
+                deleted = [item['Key'] for item in res.get('Deleted', [])]
+            return deleted, errors
+
+        result = {'Deleted': [], 'Errors': []}
+        pending = list(key_list)
+        for attempt in range(1, self.max_retries + 1):
+            batches = [pending[i:i+max_keys_num] for i in range(0, len(pending), max_keys_num)]
+            if not batches:
+                break
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+                responses = list(executor.map(delete_batch, batches))
+
+            pending = []
+            for deleted, errors in responses:
+                result['Deleted'].extend(deleted)
+                for error in errors:
+                    if error['Code'] in aws_s3_config.RETRYABLE_ERRORS and attempt < self.max_retries:
+                        pending.append(error['Key'])
+                    else:
+                        result['Errors'].append(error)
+            if pending:
+                logger.debug('DELETE Objects - Retrying {} keys (attempt {}/{})'
+                             .format(len(pending), attempt, self.max_retries))
+                time.sleep(_backoff(attempt))
+
+        logger.debug('DELETE Objects - {} deleted - {} failed'
+                     .format(len(result['Deleted']), len(result['Errors'])))
         return result
 
     def bucket_exists(self, bucket_name):
@@ -163,33 +548,145 @@ class S3Backend:
             else:
                 raise e
 
-    def list_objects(self, bucket_name, prefix=None):
+    def _list_pages(self, bucket_name, prefix, **list_args):
         """
-        Return a list of objects for the given bucket and prefix.
-        :param bucket_name: Name of the bucket.
-        :param prefix: Prefix to filter object names.
-        :return: List of objects in bucket that match the given prefix.
-        :rtype: list of str
+        Iterate over the raw 'list_objects_v2' pages of the given prefix.
+        Throws StorageNoSuchKeyError if the bucket does not exist.
         """
         try:
-            prefix = '' if prefix is None else prefix
             paginator = self.s3_client.get_paginator('list_objects_v2')
-            page_iterator = paginator.paginate(
-                Bucket=bucket_name, Prefix=prefix)
-
-            object_list = []
-            for page in page_iterator:
-                if 'Contents' in page:
-                    for item in page['Contents']:
-                        object_list.append(item)
-            return object_list
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, **list_args):
+                yield page
         except botocore.exceptions.ClientError as e:
             if e.response['Error']['Code'] == '404':
-                raise StorageNoSuchKeyError(
-                    bucket_name, '' if prefix is None else prefix)
+                raise StorageNoSuchKeyError(bucket_name, prefix)
             else:
                 raise e
 
+    def iter_objects(self, bucket_name, prefix=None, start_after=None):
+        """
+        Yield the objects for the given bucket and prefix, one listing page at a time.
+        :param bucket_name: Name of the bucket.
+        :param prefix: Prefix to filter object names.
+        :param start_after: Only list the keys that sort after this one.
+        :return: Generator of objects in bucket that match the given prefix.
+        :rtype: generator of dict
+        """
+        prefix = '' if prefix is None else prefix
+        list_args = {'StartAfter': start_after} if start_after else {}
+        for page in self._list_pages(bucket_name, prefix, **list_args):
+            if 'Contents' in page:
+                for item in page['Contents']:
+                    yield item
+
+    def iter_keys(self, bucket_name, prefix=None, start_after=None):
+        """
+        Yield the keys for the given prefix, one listing page at a time.
+        :param bucket_name: Name of the bucket.
+        :param prefix: Prefix to filter object names.
+        :param start_after: Only list the keys that sort after this one.
+        :return: Generator of keys in bucket that match the given prefix.
+        :rtype: generator of str
+        """
+        for item in self.iter_objects(bucket_name, prefix, start_after):
+            yield item['Key']
+
+    def iter_objects_parallel(self, bucket_name, prefix=None, shards=None, delimiter='/'):
+        """
+        Yield the objects for the given bucket and prefix, listing disjoint shards of the keyspace
+        concurrently. Shards are the CommonPrefixes found under the prefix with the given delimiter,
+        unless a list of shard prefixes is supplied. At most a few listing pages per worker are
+        buffered, so memory stays bounded. Objects are not yielded in lexicographic order.
+        :param bucket_name: Name of the bucket.
+        :param prefix: Prefix to filter object names.
+        :param shards: Optional list of disjoint prefixes to list concurrently.
+        :param delimiter: Delimiter used to discover the shards.
+        :return: Generator of objects in bucket that match the given prefix (or shards).
+        :rtype: generator of dict
+        """
+        prefix = '' if prefix is None else prefix
+        if shards is None:
+            shards = []
+            for page in self._list_pages(bucket_name, prefix, Delimiter=delimiter):
+                for item in page.get('Contents', []):
+                    yield item
+                shards.extend(common_prefix['Prefix'] for common_prefix in page.get('CommonPrefixes', []))
+        if not shards:
+            return
+
+        pages = queue.Queue(maxsize=2 * self.max_concurrency)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def list_shard(shard):
+            try:
+                for page in self._list_pages(bucket_name, shard):
+                    if stop.is_set():
+                        return
+                    if 'Contents' in page:
+                        put(page['Contents'])
+            except Exception as e:
+                put(e)
+            finally:
+                put(None)
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(shards)))
+        try:
+            for shard in shards:
+                executor.submit(list_shard, shard)
+            pending = len(shards)
+            while pending > 0:
+                contents = pages.get()
+                if contents is None:
+                    pending -= 1
+                elif isinstance(contents, Exception):
+                    raise contents
+                else:
+                    for item in contents:
+                        yield item
+        finally:
+            stop.set()
+            executor.shutdown(wait=False)
+
+    def iter_keys_parallel(self, bucket_name, prefix=None, shards=None, delimiter='/'):
+        """
+        Yield the keys for the given prefix, listing shards of the keyspace concurrently.
+        See iter_objects_parallel().
+        :rtype: generator of str
+        """
+        for item in self.iter_objects_parallel(bucket_name, prefix, shards, delimiter):
+            yield item['Key']
+
+    def listing_cursor(self, bucket_name, prefix=None, shards=None,
+                       reconcile_interval=aws_s3_config.LISTING_RECONCILE_INTERVAL):
+        """
+        Return a cursor whose poll() only lists the keys created since the previous poll.
+        :param bucket_name: Name of the bucket.
+        :param prefix: Prefix to track.
+        :param shards: Optional list of prefixes, each one tracked with its own cursor.
+        :param reconcile_interval: Seconds between full listings that catch keys created out of order
+                                   (None to disable them).
+        :rtype: ListingCursor
+        """
+        return ListingCursor(self, bucket_name, prefix, shards, reconcile_interval)
+
+    def list_objects(self, bucket_name, prefix=None):
+        """
+        Return a list of objects for the given bucket and prefix.
+        :param bucket_name: Name of the bucket.
+        :param prefix: Prefix to filter object names.
+        :return: List of objects in bucket that match the given prefix.
+        :rtype: list of str
+        """
+        return list(self.iter_objects(bucket_name, prefix))
+
     def list_keys(self, bucket_name, prefix=None):
         """
         Return a list of keys for the given prefix.
@@ -198,20 +695,84 @@ class S3Backend:
         :return: List of keys in bucket that match the given prefix.
         :rtype: list of str
         """
-        try:
-            prefix = '' if prefix is None else prefix
-            paginator = self.s3_client.get_paginator('list_objects_v2')
-            page_iterator = paginator.paginate(
-                Bucket=bucket_name, Prefix=prefix)
-
-            key_list = []
-            for page in page_iterator:
-                if 'Contents' in page:
-                    for item in page['Contents']:
-                        key_list.append(item['Key'])
-            return key_list
-        except botocore.exceptions.ClientError as e:
-            if e.response['Error']['Code'] == '404':
-                raise StorageNoSuchKeyError(bucket_name, prefix)
-            else:
-                raise e
+        return list(self.iter_keys(bucket_name, prefix))
+
+
+class ListingCursor:
+    """
+    Incremental listing of a prefix, for polling-based completion tracking.
+    Every shard remembers the last key it has returned and the next poll resumes
+    the listing from there with 'StartAfter', so each poll only pays for the new keys.
+    Keys created out of order (sorting before the last key seen in their shard) are
+    missed by incremental polls, so every 'reconcile_interval' seconds a poll lists the
+    whole shards again and also returns the keys it had not seen. Split the keyspace in
+    shards whose keys are created in lexicographic order (e.g. one shard per call or per
+    job) to make reconciliations rare, and remove the shards that are no longer expected to change.
+    """
+
+    def __init__(self, storage_backend, bucket_name, prefix=None, shards=None,
+                 reconcile_interval=aws_s3_config.LISTING_RECONCILE_INTERVAL):
+        self.storage_backend = storage_backend
+        self.bucket_name = bucket_name
+        self.reconcile_interval = reconcile_interval
+        self.last_keys = {}
+        self.first_keys = {}
+        self.seen_keys = {}
+        self.last_reconcile = time.monotonic()
+        if shards is None:
+            shards = ['' if prefix is None else prefix]
+        for shard in shards:
+            self.add_shard(shard)
+
+    def add_shard(self, prefix, start_after=None):
+        """
+        Start tracking a new shard, optionally resuming after a known key
+        """
+        self.last_keys[prefix] = start_after
+        self.first_keys[prefix] = start_after
+        self.seen_keys[prefix] = set()
+
+    def remove_shard(self, prefix):
+        """
+        Stop tracking a shard (e.g. all its expected keys have been seen)
+        """
+        self.last_keys.pop(prefix, None)
+        self.first_keys.pop(prefix, None)
+        self.seen_keys.pop(prefix, None)
+
+    def _poll_shard(self, prefix, reconcile=False):
+        start_after = self.first_keys[prefix] if reconcile else self.last_keys[prefix]
+        keys = list(self.storage_backend.iter_keys(self.bucket_name, prefix, start_after))
+        seen = self.seen_keys[prefix]
+        if reconcile:
+            keys = [key for key in keys if key not in seen]
+        if keys:
+            seen.update(keys)
+            self.last_keys[prefix] = max(keys[-1], self.last_keys[prefix] or '')
+        return keys
+
+    def poll(self, reconcile=None):
+        """
+        List the keys created since the previous poll
+        :param reconcile: list the whole shards to catch keys created out of order
+                          (defaults to every 'reconcile_interval' seconds)
+        :return: List of new keys, grouped by shard
+        :rtype: list of str
+        """
+        if reconcile is None:
+            reconcile = self.reconcile_interval is not None and \
+                time.monotonic() - self.last_reconcile >= self.reconcile_interval
+        if reconcile:
+            self.last_reconcile = time.monotonic()
+
+        def poll_shard(shard):
+            return self._poll_shard(shard, reconcile)
+
+        shards = list(self.last_keys)
+        if len(shards) == 1:
+            return poll_shard(shards[0])
+
+        max_workers = min(self.storage_backend.max_concurrency, len(shards)) or 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            new_keys = executor.map(poll_shard, shards)
+        return [key for keys in new_keys for key in keys]
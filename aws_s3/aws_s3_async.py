@@ -0,0 +1,301 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import asyncio
+import logging
+import contextlib
+import botocore
+from ..utils import StorageNoSuchKeyError
+from . import config as aws_s3_config
+from .aws_s3 import _backoff
+
+try:
+    from aiobotocore.session import get_session
+except ImportError:
+    get_session = None
+
+logger = logging.getLogger(__name__)
+
+
+async def bounded_gather(func, items, max_concurrency):
+    """
+    Await func(item) for every item, with at most 'max_concurrency' calls in flight.
+    Exceptions raised by func are returned as results.
+    :return: list of results, in the order of the items
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(item):
+        async with semaphore:
+            return await func(item)
+
+    return await asyncio.gather(*[run(item) for item in items], return_exceptions=True)
+
+
+class AsyncS3Backend:
+    """
+    Asyncio counterpart of S3Backend, built on aiobotocore. Every storage call is a coroutine,
+    so thousands of requests can be in flight from a single event loop without threads.
+    The client is opened on first use and must be released with close(), or by using the
+    backend as an async context manager:
+
+        async with AsyncS3Backend(s3_config) as storage:
+            data = await storage.get_object(bucket, key)
+    """
+
+    def __init__(self, s3_config, bucket=None, executor_id=None):
+        if get_session is None:
+            raise Exception("The 'aiobotocore' package is required by the asyncio S3 backend")
+
+        self.service_endpoint = s3_config.get('endpoint').replace('http:', 'https:')
+        self.access_key_id = s3_config['access_key_id']
+        self.secret_access_key = s3_config['secret_access_key']
+        self.max_pool_connections = s3_config.get('max_pool_connections', aws_s3_config.CLIENT_POOL_SIZE)
+        self.bulk_max_concurrency = s3_config.get('bulk_max_concurrency', aws_s3_config.BULK_MAX_CONCURRENCY)
+        self.max_retries = max(1, s3_config.get('max_retries', aws_s3_config.MAX_RETRIES))
+        self.s3_client = None
+        self._exit_stack = None
+        self._client_lock = None
+        logger.debug("Set AWS S3 Endpoint to {} (asyncio)".format(self.service_endpoint))
+
+    async def __aenter__(self):
+        await self.get_client()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def get_client(self):
+        """
+        Get the aiobotocore client, opening it on first use.
+        :return: aiobotocore client
+        """
+        if self._client_lock is None:
+            self._client_lock = asyncio.Lock()
+        async with self._client_lock:
+            if self.s3_client is None:
+                client_config = botocore.config.Config(max_pool_connections=self.max_pool_connections,
+                                                       user_agent_extra='cloudbutton',
+                                                       connect_timeout=1)
+                self._exit_stack = contextlib.AsyncExitStack()
+                client = get_session().create_client('s3',
+                                                     aws_access_key_id=self.access_key_id,
+                                                     aws_secret_access_key=self.secret_access_key,
+                                                     config=client_config,
+                                                     endpoint_url=self.service_endpoint)
+                self.s3_client = await self._exit_stack.enter_async_context(client)
+        return self.s3_client
+
+    async def close(self):
+        """
+        Closes the client and its connections.
+        """
+        if self._exit_stack is not None:
+            await self._exit_stack.aclose()
+        self._exit_stack = None
+        self.s3_client = None
+
+    async def put_object(self, bucket_name, key, data):
+        """
+        Put an object in COS. Override the object if the key already exists.
+        :param key: key of the object.
+        :param data: data of the object
+        :type data: str/bytes
+        :return: None
+        """
+        client = await self.get_client()
+        try:
+            res = await client.put_object(Bucket=bucket_name, Key=key, Body=data)
+            status = 'OK' if res['ResponseMetadata']['HTTPStatusCode'] == 200 else 'Error'
+            logger.debug('PUT Object {} - Size: {} - {}'.format(key, len(data), status))
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == "NoSuchKey":
+                raise StorageNoSuchKeyError(bucket_name, key)
+            else:
+                raise e
+
+    async def get_object(self, bucket_name, key, stream=False, extra_get_args={}):
+        """
+        Get object from COS with a key. Throws StorageNoSuchKeyError if the given key does not exist.
+        :param key: key of the object
+        :param stream: return the aiobotocore streaming body instead of its content
+        :return: Data of the object
+        :rtype: bytes/StreamReader
+        """
+        client = await self.get_client()
+        try:
+            r = await client.get_object(Bucket=bucket_name, Key=key, **extra_get_args)
+            if stream:
+                return r['Body']
+            async with r['Body'] as body:
+                return await body.read()
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == "NoSuchKey":
+                raise StorageNoSuchKeyError(bucket_name, key)
+            else:
+                raise e
+
+    async def get_objects(self, bucket_name, keys, max_concurrency=None):
+        """
+        Get many objects concurrently. A missing key does not abort the batch:
+        its result is a StorageNoSuchKeyError instance.
+        :param keys: keys of the objects
+        :param max_concurrency: max. number of requests in flight (defaults to 'bulk_max_concurrency')
+        :return: list of (key, data) tuples, where data is the exception raised for failed keys
+        :rtype: list of tuple
+        """
+        async def get_object(key):
+            return await self.get_object(bucket_name, key)
+
+        keys = list(keys)
+        results = await bounded_gather(get_object, keys, max_concurrency or self.bulk_max_concurrency)
+        return list(zip(keys, results))
+
+    async def put_objects(self, bucket_name, objects, max_concurrency=None):
+        """
+        Put many objects concurrently.
+        :param objects: dict of {key: data}
+        :param max_concurrency: max. number of requests in flight (defaults to 'bulk_max_concurrency')
+        :return: list of (key, error) tuples, where error is None for the keys stored successfully
+        :rtype: list of tuple
+        """
+        async def put_object(key):
+            return await self.put_object(bucket_name, key, objects[key])
+
+        keys = list(objects)
+        results = await bounded_gather(put_object, keys, max_concurrency or self.bulk_max_concurrency)
+        return list(zip(keys, results))
+
+    async def head_object(self, bucket_name, key):
+        """
+        Head object from COS with a key. Throws StorageNoSuchKeyError if the given key does not exist.
+        :param key: key of the object
+        :return: Metadata of the object
+        :rtype: dict
+        """
+        client = await self.get_client()
+        try:
+            metadata = await client.head_object(Bucket=bucket_name, Key=key)
+            return metadata['ResponseMetadata']['HTTPHeaders']
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == '404':
+                raise StorageNoSuchKeyError(bucket_name, key)
+            else:
+                raise e
+
+    async def delete_object(self, bucket_name, key):
+        """
+        Delete an object from storage.
+        :param bucket: bucket name
+        :param key: data key
+        """
+        client = await self.get_client()
+        return await client.delete_object(Bucket=bucket_name, Key=key)
+
+    async def delete_objects(self, bucket_name, key_list, quiet=True):
+        """
+        Delete a list of objects from storage. Batches of up to 1000 keys are sent concurrently,
+        and the keys that fail with a transient error are retried on their own.
+        :param bucket: bucket name
+        :param key_list: list of keys
+        :param quiet: use quiet mode, so that responses only carry the keys that failed
+        :return: dict with the 'Deleted' keys and the 'Errors' ({'Key', 'Code', 'Message'}) of the failed keys
+        """
+        max_keys_num = 1000
+        client = await self.get_client()
+
+        async def delete_batch(keys):
+            delete_keys = {'Objects': [{'Key': k} for k in keys], 'Quiet': quiet}
+            try:
+                res = await client.delete_objects(Bucket=bucket_name, Delete=delete_keys)
+            except botocore.exceptions.ClientError as e:
+                code = e.response['Error']['Code']
+                if e.response['ResponseMetadata'].get('HTTPStatusCode', 500) >= 500:
+                    code = 'InternalError'
+                return [], [{'Key': k, 'Code': code, 'Message': e.response['Error'].get('Message', '')}
+                            for k in keys]
+            except (botocore.exceptions.BotoCoreError, asyncio.TimeoutError) as e:
+                return [], [{'Key': k, 'Code': 'RequestError', 'Message': str(e)} for k in keys]
+
+            errors = res.get('Errors', [])
+            if quiet:
+                failed = set(error['Key'] for error in errors)
+                deleted = [k for k in keys if k not in failed]
+            else:
+                deleted = [item['Key'] for item in res.get('Deleted', [])]
+            return deleted, errors
+
+        result = {'Deleted': [], 'Errors': []}
+        pending = list(key_list)
+        for attempt in range(1, self.max_retries + 1):
+            batches = [pending[i:i+max_keys_num] for i in range(0, len(pending), max_keys_num)]
+            if not batches:
+                break
+            responses = await bounded_gather(delete_batch, batches, self.bulk_max_concurrency)
+
+            pending = []
+            for response in responses:
+                if isinstance(response, Exception):
+                    raise response
+                deleted, errors = response
+                result['Deleted'].extend(deleted)
+                for error in errors:
+                    if error['Code'] in aws_s3_config.RETRYABLE_ERRORS and attempt < self.max_retries:
+                        pending.append(error['Key'])
+                    else:
+                        result['Errors'].append(error)
+            if pending:
+                logger.debug('DELETE Objects - Retrying {} keys (attempt {}/{})'
+                             .format(len(pending), attempt, self.max_retries))
+                await asyncio.sleep(_backoff(attempt))
+
+        logger.debug('DELETE Objects - {} deleted - {} failed'
+                     .format(len(result['Deleted']), len(result['Errors'])))
+        return result
+
+    async def iter_keys(self, bucket_name, prefix=None, start_after=None):
+        """
+        Yield the keys for the given bucket and prefix, one listing page at a time.
+        :param bucket_name: Name of the bucket.
+        :param prefix: Prefix to filter object names.
+        :param start_after: Only list the keys that sort after this one.
+        :return: Async generator of keys in bucket that match the given prefix.
+        :rtype: async generator of str
+        """
+        client = await self.get_client()
+        list_args = {'Bucket': bucket_name, 'Prefix': '' if prefix is None else prefix}
+        if start_after is not None:
+            list_args['StartAfter'] = start_after
+        try:
+            paginator = client.get_paginator('list_objects_v2')
+            async for page in paginator.paginate(**list_args):
+                for obj in page.get('Contents', []):
+                    yield obj['Key']
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == '404':
+                raise StorageNoSuchKeyError(bucket_name, list_args['Prefix'])
+            else:
+                raise e
+
+    async def list_keys(self, bucket_name, prefix=None):
+        """
+        Return a list of keys for the given prefix.
+        :param bucket_name: Name of the bucket.
+        :param prefix: Prefix to filter object names.
+        :return: List of keys in bucket that match the given prefix.
+        :rtype: list of str
+        """
+        return [key async for key in self.iter_keys(bucket_name, prefix)]
@@ -0,0 +1,266 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import json
+import mmap
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from . import config as aws_s3_config
+
+logger = logging.getLogger(__name__)
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class DiskCache:
+    """
+    Size-bounded LRU cache of S3 objects on local disk (e.g. Lambda /tmp), shared by the
+    processes that use the same directory (e.g. forked job runners): the directory is the
+    source of truth, entries missing from the in-memory index are looked up on disk, and
+    the size limit is enforced against the directory contents. Every entry keeps the ETag
+    it was downloaded with: entries younger than 'ttl' seconds are trusted, older ones are
+    revalidated with a conditional request. Cached data can also be read through memory-mapped files, so
+    large objects are not copied into the Python heap.
+    """
+
+    def __init__(self, cache_dir=aws_s3_config.CACHE_DIR, max_bytes=aws_s3_config.CACHE_MAX_BYTES,
+                 ttl=aws_s3_config.CACHE_TTL):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self.counters = {'hits': 0, 'revalidated': 0, 'misses': 0, 'evictions': 0,
+                         'bytes_from_cache': 0, 'bytes_from_network': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._entries, self._size = self._scan()
+        logger.debug('Disk cache {} - {} entries - Size: {}'.format(self.cache_dir, len(self._entries), self._size))
+
+    def _entry_path(self, bucket_name, key):
+        entry_id = hashlib.sha256('{}/{}'.format(bucket_name, key).encode()).hexdigest()
+        return os.path.join(self.cache_dir, entry_id)
+
+    def _scan(self):
+        """
+        Reads the index of the entries in the cache directory, written by this or other processes
+        return : (OrderedDict of entries, least recently used first, total size)
+        """
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith('.meta'):
+                continue
+            meta_path = os.path.join(self.cache_dir, file_name)
+            try:
+                with open(meta_path, 'r') as meta_file:
+                    entry = json.load(meta_file)
+                entries.append((os.path.getmtime(meta_path), entry))
+            except (IOError, OSError, ValueError):
+                continue
+        index = OrderedDict(((entry['bucket'], entry['key']), entry)
+                            for _, entry in sorted(entries, key=lambda e: e[0]))
+        return index, sum(entry['size'] for entry in index.values())
+
+    def _read_meta(self, bucket_name, key):
+        try:
+            with open(self._entry_path(bucket_name, key) + '.meta', 'r') as meta_file:
+                return json.load(meta_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def lookup(self, bucket_name, key):
+        """
+        return : the cache entry of an object (also if another process stored it), or None
+        """
+        with self._lock:
+            entry = self._entries.get((bucket_name, key))
+        if entry is not None:
+            return entry
+        entry = self._read_meta(bucket_name, key)
+        if entry is not None:
+            with self._lock:
+                previous = self._entries.pop((bucket_name, key), None)
+                self._size += entry['size'] - (previous['size'] if previous else 0)
+                self._entries[(bucket_name, key)] = entry
+        return entry
+
+    def is_fresh(self, entry, ttl=None):
+        """
+        return : True if the entry can be used without revalidation ('ttl' defaults to the cache TTL)
+        """
+        return time.time() - entry['stored_at'] < (self.ttl if ttl is None else ttl)
+
+    def read(self, entry, revalidated=False, memory_map=False):
+        """
+        Reads a cached object, and marks it as the most recently used
+        :param memory_map: return a read-only memory map of the file instead of its content
+        return : object data, or None if the entry is gone
+        :rtype: bytes/mmap
+        """
+        path = self._entry_path(entry['bucket'], entry['key'])
+        try:
+            with open(path, 'rb') as entry_file:
+                if not memory_map:
+                    data = entry_file.read()
+                elif entry['size'] == 0:
+                    data = b''
+                else:
+                    data = mmap.mmap(entry_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            self.discard(entry['bucket'], entry['key'])
+            return None
+
+        with self._lock:
+            self.counters['revalidated' if revalidated else 'hits'] += 1
+            self.counters['bytes_from_cache'] += entry['size']
+            if (entry['bucket'], entry['key']) in self._entries:
+                self._entries.move_to_end((entry['bucket'], entry['key']))
+        try:
+            os.utime(path + '.meta')
+        except OSError:
+            pass
+        return data
+
+    def refresh(self, entry):
+        """
+        Restarts the TTL of an entry that was revalidated against S3
+        """
+        entry['stored_at'] = time.time()
+        self._write_meta(entry)
+
+    def _write_file(self, path, data):
+        """
+        Writes a file atomically. Temporary files have unique names, so that concurrent
+        writers (threads or processes) of the same entry do not corrupt each other.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except (IOError, OSError):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _write_meta(self, entry):
+        path = self._entry_path(entry['bucket'], entry['key']) + '.meta'
+        self._write_file(path, json.dumps(entry).encode())
+
+    def put(self, bucket_name, key, etag, data):
+        """
+        Stores a downloaded object. Objects larger than the whole cache are not stored.
+        """
+        with self._lock:
+            self.counters['misses'] += 1
+            self.counters['bytes_from_network'] += len(data)
+        if etag is None or len(data) > self.max_bytes:
+            return
+
+        entry = {'bucket': bucket_name, 'key': key, 'etag': etag, 'size': len(data), 'stored_at': time.time()}
+        path = self._entry_path(bucket_name, key)
+        try:
+            self._write_file(path, data)
+            self._write_meta(entry)
+        except (IOError, OSError) as e:
+            logger.debug('Unable to cache object {}: {}'.format(key, e))
+            return
+
+        # Other processes may have stored entries too: evict against the directory contents
+        entries, size = self._scan()
+        with self._lock:
+            self._entries, self._size = entries, size
+            evicted = self._evict()
+        for evicted_entry in evicted:
+            self._remove_files(evicted_entry)
+
+    def resize(self, max_bytes):
+        """
+        Changes the size limit of the cache, evicting entries if it shrinks
+        """
+        entries, size = self._scan()
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._entries, self._size = entries, size
+            evicted = self._evict()
+        for evicted_entry in evicted:
+            self._remove_files(evicted_entry)
+
+    def _evict(self):
+        evicted = []
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._size -= entry['size']
+            self.counters['evictions'] += 1
+            evicted.append(entry)
+        return evicted
+
+    def _remove_files(self, entry):
+        path = self._entry_path(entry['bucket'], entry['key'])
+        for entry_path in (path + '.meta', path):
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+
+    def discard(self, bucket_name, key):
+        """
+        Drops a cached object (e.g. after it was overwritten or deleted)
+        """
+        with self._lock:
+            entry = self._entries.pop((bucket_name, key), None)
+            if entry is not None:
+                self._size -= entry['size']
+        # The entry may have been stored by another process, so its files are removed anyway
+        self._remove_files({'bucket': bucket_name, 'key': key})
+
+    def stats(self):
+        """
+        Request counters of this process, and entries/size of the whole cache directory
+        """
+        entries, size = self._scan()
+        with self._lock:
+            requests = self.counters['hits'] + self.counters['revalidated'] + self.counters['misses']
+            return {**self.counters,
+                    'entries': len(entries),
+                    'size': size,
+                    'hit_ratio': (requests - self.counters['misses']) / requests if requests else 0.0}
+
+
+def get_disk_cache(cache_dir, max_bytes, ttl):
+    """
+    Returns the process-wide cache of a directory, so every backend shares its index and counters.
+    A directory has a single size limit: the last requested one is applied. The TTL is only the
+    default of the cache, backends can use their own with is_fresh().
+    """
+    cache_dir = os.path.abspath(cache_dir)
+    with _caches_lock:
+        if cache_dir not in _caches:
+            _caches[cache_dir] = DiskCache(cache_dir, max_bytes, ttl)
+            return _caches[cache_dir]
+        cache = _caches[cache_dir]
+    if cache.max_bytes != max_bytes:
+        logger.debug('Disk cache {} - Size limit changed from {} to {}'.format(cache_dir, cache.max_bytes, max_bytes))
+        cache.resize(max_bytes)
+    return cache
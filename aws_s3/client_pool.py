@@ -0,0 +1,95 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import logging
+import threading
+import boto3
+import botocore
+from . import config as aws_s3_config
+
+logger = logging.getLogger(__name__)
+
+
+class ClientPool:
+    """
+    Process-wide registry of boto3 clients, shared by every backend instance (and executor).
+    The compute plugin imports this same module, so Lambda-side and storage clients with
+    the same settings are shared too.
+    Clients are keyed by service, region, endpoint, credentials and client options, so their
+    connection pools stay warm across executors.
+
+    Thread safety: boto3 sessions are not thread-safe, so clients are only created under the
+    registry lock, each from its own session. Created clients are thread-safe and are used
+    concurrently without locking. When a larger connection pool is requested for an existing
+    key, a new client replaces it; clients already handed out remain valid.
+    Pooled connections must not be shared with forked processes, so the registry is emptied
+    when it is used from a new pid.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def get_client(self, service, region_name=None, endpoint_url=None, access_key_id=None,
+                   secret_access_key=None, session_token=None,
+                   max_pool_connections=aws_s3_config.CLIENT_POOL_SIZE, **config_args):
+        """
+        Returns the shared client for the given service/region/endpoint/credentials,
+        creating it on first use.
+        :param max_pool_connections: minimum size of the client's connection pool
+        :param config_args: other botocore.client.Config options (e.g. read_timeout)
+        return : boto3 client
+        """
+        client_key = (service, region_name, endpoint_url, access_key_id, secret_access_key,
+                      session_token, tuple(sorted(config_args.items())))
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._clients = {}
+                self._pid = os.getpid()
+
+            if client_key in self._clients:
+                client, pool_size = self._clients[client_key]
+                if pool_size >= max_pool_connections:
+                    return client
+
+            client_config = botocore.client.Config(max_pool_connections=max_pool_connections,
+                                                   user_agent_extra='cloudbutton',
+                                                   **config_args)
+            session = boto3.session.Session(aws_access_key_id=access_key_id,
+                                            aws_secret_access_key=secret_access_key,
+                                            aws_session_token=session_token,
+                                            region_name=region_name)
+            client = session.client(service, endpoint_url=endpoint_url, config=client_config)
+            self._clients[client_key] = (client, max_pool_connections)
+            logger.debug('Created {} client - Region: {} - Endpoint: {} - Pool size: {}'
+                         .format(service, region_name, endpoint_url, max_pool_connections))
+            return client
+
+    def clear(self):
+        """
+        Drops every registered client
+        """
+        with self._lock:
+            self._clients = {}
+
+    def __len__(self):
+        return len(self._clients)
+
+
+client_pool = ClientPool()
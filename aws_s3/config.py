@@ -14,6 +14,37 @@
 # limitations under the License.
 #
 
+import os
+import tempfile
+
+MULTIPART_THRESHOLD = 64 * 1024 ** 2  # Objects larger than 64 MiB are uploaded in parts
+MULTIPART_CHUNKSIZE = 16 * 1024 ** 2  # Part size: 16 MiB
+MULTIPART_MIN_CHUNKSIZE = 5 * 1024 ** 2  # S3 minimum part size: 5 MiB
+MULTIPART_MAX_PARTS = 10000  # S3 maximum number of parts per upload
+RANGE_GET_CHUNKSIZE = 16 * 1024 ** 2  # Byte-range size of parallel downloads: 16 MiB
+READ_BLOCKSIZE = 1024 ** 2  # Socket read size when assembling downloads: 1 MiB
+MAX_CONCURRENCY = 16  # Max. concurrent requests per transfer
+BULK_MAX_CONCURRENCY = 64  # Max. concurrent requests of get_objects()/put_objects()
+MAX_RETRIES = 3  # Attempts per part/request before giving up
+RETRY_BACKOFF_BASE = 0.1  # Base of the jittered exponential backoff between attempts (s)
+RETRY_BACKOFF_MAX = 5  # Max. backoff between attempts (s)
+CLIENT_POOL_SIZE = 128  # Connections kept alive per shared boto3 client
+WARM_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'pywren_warm_cache')
+WARM_CACHE_MAX_BYTES = 256 * 1024 ** 2  # Immutable objects kept across invocations: 256 MiB
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'pywren_cache')
+CACHE_MAX_BYTES = 256 * 1024 ** 2  # Local disk cache of get_object(): 256 MiB
+CACHE_TTL = 0  # Seconds a cached object is trusted without revalidation
+READER_BLOCKSIZE = 4 * 1024 ** 2  # Range size of open_object() readers: 4 MiB
+READER_READAHEAD = 4  # Blocks prefetched ahead of sequential open_object() reads
+PACK_TAIL_SIZE = 64 * 1024  # Bytes fetched from the end of a packed object to read its index
+PACK_MAX_GAP = 256 * 1024  # Max. unrequested bytes read to coalesce two pack entries in one request
+PACK_MAX_SPAN = 16 * 1024 ** 2  # Max. size of a coalesced pack read
+PARTITION_CHUNKSIZE = 64 * 1024 ** 2  # Target size of record-aligned partitions: 64 MiB
+PARTITION_PROBE_SIZE = 64 * 1024  # First read size when looking for a record boundary
+LISTING_RECONCILE_INTERVAL = 30  # Seconds between full listings of a listing cursor's shards
+RETRYABLE_ERRORS = ('InternalError', 'ServiceUnavailable', 'SlowDown', 'RequestTimeout', 'RequestError')
+
+
 def load_config(config_data=None):
     if 'aws' not in config_data and 'aws_s3' not in config_data:
         raise Exception("'aws' and 'aws_s3' sections are mandatory in the configuration")
@@ -26,4 +57,4 @@ def load_config(config_data=None):
     config_data['aws_s3'] = {**config_data['aws_s3'], **config_data['aws']}
     
     if 'endpoint' not in config_data['aws_s3']:
-        raise Exception("'endpoint' is mandatory under 's3' section")
\ No newline at end of file
+        raise Exception("'endpoint' is mandatory under 's3' section")
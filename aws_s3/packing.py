@@ -0,0 +1,233 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Packed objects store many small logical objects (entries) in a single S3 object:
+
+    entry data | entry data | ... | index | footer
+
+The index is a zlib-compressed sequence of (name length, entry length, name) records,
+in data order, so entry offsets are the running sum of the lengths. The fixed-size
+footer holds the index length, the number of entries and a magic number. Readers fetch
+the tail of the object with a single suffix Range GET (which usually holds the whole
+index, and the whole pack if it is small), then read entries with Range GETs,
+coalescing nearby entries into one request.
+"""
+
+import zlib
+import struct
+import logging
+from . import config as aws_s3_config
+from .aws_s3 import _bounded_map
+
+logger = logging.getLogger(__name__)
+
+PACK_MAGIC = b'PWPK'
+FOOTER = struct.Struct('<QI4s')  # index length, number of entries, magic
+INDEX_RECORD = struct.Struct('<HQ')  # name length, entry length
+
+
+class PackWriter:
+    """
+    Appends entries in memory and stores them as one packed object
+
+        with PackWriter(storage, bucket, key) as pack:
+            pack.add('result-0', data)
+    """
+
+    def __init__(self, storage, bucket_name, key):
+        self.storage = storage
+        self.bucket_name = bucket_name
+        self.key = key
+        self.chunks = []
+        self.index = []
+        self.names = set()
+        self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def add(self, name, data):
+        """
+        Appends an entry to the pack
+        :param name: name of the entry, unique within the pack
+        :param data: data of the entry
+        :type data: str/bytes
+        """
+        if name in self.names:
+            raise Exception('Entry {} already exists in pack {}'.format(name, self.key))
+        if isinstance(data, str):
+            data = data.encode()
+        self.names.add(name)
+        self.index.append((name.encode(), len(data)))
+        self.chunks.append(data)
+        self.size += len(data)
+
+    def to_bytes(self):
+        """
+        return : the packed object content
+        """
+        index = b''.join(INDEX_RECORD.pack(len(name), length) + name for name, length in self.index)
+        index = zlib.compress(index)
+        footer = FOOTER.pack(len(index), len(self.index), PACK_MAGIC)
+        return b''.join(self.chunks + [index, footer])
+
+    def close(self):
+        """
+        Stores the pack with a single PUT
+        """
+        data = self.to_bytes()
+        self.storage.put_object(self.bucket_name, self.key, data)
+        logger.debug('PUT Pack {} - {} entries - Size: {}'.format(self.key, len(self.index), len(data)))
+
+
+class PackReader:
+    """
+    Reads entries of a packed object with Range GETs. The index is fetched once, on first use.
+    """
+
+    def __init__(self, storage, bucket_name, key, tail_size=aws_s3_config.PACK_TAIL_SIZE,
+                 max_gap=aws_s3_config.PACK_MAX_GAP, max_span=aws_s3_config.PACK_MAX_SPAN):
+        self.storage = storage
+        self.bucket_name = bucket_name
+        self.key = key
+        self.tail_size = max(tail_size, FOOTER.size)
+        self.max_gap = max_gap
+        self.max_span = max_span
+        self.entries = None
+        self.tail = b''
+        self.tail_offset = None
+
+    def _get_range(self, start, end):
+        range_args = {'Range': 'bytes={}-{}'.format(start, end)}
+        return self.storage.get_object(self.bucket_name, self.key, extra_get_args=range_args)
+
+    def _load_index(self):
+        tail = self.storage.get_object(self.bucket_name, self.key,
+                                       extra_get_args={'Range': 'bytes=-{}'.format(self.tail_size)})
+        index_length, num_entries, magic = FOOTER.unpack(tail[-FOOTER.size:])
+        if magic != PACK_MAGIC:
+            raise Exception('Object {} is not a packed object'.format(self.key))
+
+        trailer_length = index_length + FOOTER.size
+        if trailer_length > len(tail):
+            tail = self.storage.get_object(self.bucket_name, self.key,
+                                           extra_get_args={'Range': 'bytes=-{}'.format(trailer_length)})
+        index = zlib.decompress(bytes(tail[-trailer_length:-FOOTER.size]))
+
+        entries, position, offset = {}, 0, 0
+        for _ in range(num_entries):
+            name_length, length = INDEX_RECORD.unpack_from(index, position)
+            position += INDEX_RECORD.size
+            name = index[position:position+name_length].decode()
+            position += name_length
+            entries[name] = (offset, length)
+            offset += length
+
+        # The entries at the end of the data were fetched along with the index
+        self.tail_offset = offset + trailer_length - len(tail)
+        self.tail = tail
+        self.entries = entries
+        logger.debug('GET Pack {} index - {} entries'.format(self.key, num_entries))
+
+    def _entry(self, name):
+        if self.entries is None:
+            self._load_index()
+        try:
+            return self.entries[name]
+        except KeyError:
+            raise Exception('Entry {} not found in pack {}'.format(name, self.key))
+
+    def names(self):
+        """
+        return : names of the entries, in data order
+        """
+        if self.entries is None:
+            self._load_index()
+        return list(self.entries)
+
+    def get(self, name):
+        """
+        Reads one entry
+        return : data of the entry
+        :rtype: bytes
+        """
+        offset, length = self._entry(name)
+        if length == 0:
+            return b''
+        if offset >= self.tail_offset:
+            start = offset - self.tail_offset
+            return bytes(self.tail[start:start+length])
+        return bytes(self._get_range(offset, offset + length - 1))
+
+    def _coalesce(self, names):
+        """
+        Groups the requested entries into runs that are read with a single Range GET:
+        consecutive entries are merged while the gap between them is at most 'max_gap'
+        bytes and the run spans at most 'max_span' bytes
+        """
+        requested = sorted(set(names), key=lambda n: self._entry(n)[0])
+        runs = []
+        for name in requested:
+            offset, length = self._entry(name)
+            if length == 0 or offset >= self.tail_offset:
+                continue
+            if runs:
+                run = runs[-1]
+                if offset - run['end'] <= self.max_gap and offset + length - run['start'] <= self.max_span:
+                    run['end'] = max(run['end'], offset + length)
+                    run['names'].append(name)
+                    continue
+            runs.append({'start': offset, 'end': offset + length, 'names': [name]})
+        return runs
+
+    def get_many(self, names, max_concurrency=None):
+        """
+        Reads several entries, coalescing nearby ones into a single request. Runs are read concurrently.
+        :param names: names of the entries
+        return : dict of {name: data}
+        """
+        names = list(names)
+        if self.entries is None:
+            self._load_index()
+        runs = self._coalesce(names)
+
+        def get_run(run):
+            return self._get_range(run['start'], run['end'] - 1)
+
+        max_concurrency = max_concurrency or getattr(self.storage, 'bulk_max_concurrency',
+                                                     aws_s3_config.BULK_MAX_CONCURRENCY)
+        results = {}
+        for run, data in _bounded_map(get_run, runs, max(1, min(max_concurrency, len(runs) or 1))):
+            if isinstance(data, Exception):
+                raise data
+            view = memoryview(data)
+            for name in run['names']:
+                offset, length = self.entries[name]
+                results[name] = bytes(view[offset-run['start']:offset-run['start']+length])
+        logger.debug('GET Pack {} - {} entries in {} requests'.format(self.key, len(names), len(runs)))
+
+        for name in names:
+            if name not in results:
+                results[name] = self.get(name)
+        return results
@@ -0,0 +1,155 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import math
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from . import config as aws_s3_config
+
+logger = logging.getLogger(__name__)
+
+
+class ByteRange:
+    """
+    Record-aligned slice [start, end) of an object, read by a worker with a ranged get_object():
+
+        data = storage.get_object(r.bucket, r.key, extra_get_args=r.get_args())
+    """
+
+    def __init__(self, bucket_name, key, start, end, object_size):
+        self.bucket = bucket_name
+        self.key = key
+        self.start = start
+        self.end = end
+        self.object_size = object_size
+
+    @property
+    def size(self):
+        return self.end - self.start
+
+    def get_args(self):
+        """
+        return : extra_get_args of the get_object() call that reads this range
+        """
+        return {'Range': 'bytes={}-{}'.format(self.start, self.end - 1)}
+
+    def to_dict(self):
+        return {'bucket': self.bucket, 'key': self.key, 'start': self.start,
+                'end': self.end, 'object_size': self.object_size}
+
+    @classmethod
+    def from_dict(cls, range_dict):
+        return cls(range_dict['bucket'], range_dict['key'], range_dict['start'],
+                   range_dict['end'], range_dict['object_size'])
+
+    def __repr__(self):
+        return 'ByteRange({}/{} [{}, {}))'.format(self.bucket, self.key, self.start, self.end)
+
+
+def _find_boundary(storage, bucket_name, key, size, offset, delimiter, probe_size):
+    """
+    Finds the first record boundary at or after 'offset': the end of the first delimiter
+    that ends at or after it. Probes are small Range GETs, doubled until a delimiter is found.
+    return : boundary offset (the object size if there is no delimiter left)
+    """
+    start = max(0, offset - len(delimiter))
+    while start < size:
+        end = min(start + probe_size, size)
+        probe = storage.get_object(bucket_name, key, extra_get_args={'Range': 'bytes={}-{}'.format(start, end - 1)})
+        position = bytes(probe).find(delimiter)
+        if position >= 0:
+            return start + position + len(delimiter)
+        # Keep the tail of the probe, in case the delimiter straddles two probes
+        start = end - len(delimiter) + 1 if end < size else size
+        probe_size *= 2
+    return size
+
+
+def _plan(bucket_name, key, size, chunk_size, num_chunks):
+    """
+    return : (nominal boundary offsets, finalize function building the ranges from the aligned boundaries)
+    """
+    if num_chunks is not None:
+        chunk_size = max(1, math.ceil(size / num_chunks))
+    offsets = list(range(chunk_size, size, chunk_size))
+
+    def finalize(boundaries):
+        ranges, start = [], 0
+        for boundary in sorted(set(boundaries)) + [size]:
+            if boundary > start:
+                ranges.append(ByteRange(bucket_name, key, start, min(boundary, size), size))
+                start = boundary
+        return ranges
+
+    return offsets, finalize
+
+
+def _align(storage, objects, chunk_size, num_chunks, delimiter, probe_size, max_concurrency):
+    """
+    Probes the boundaries of every object concurrently
+    :param objects: list of (bucket, key, size)
+    return : list of ByteRange, in object order
+    """
+    if isinstance(delimiter, str):
+        delimiter = delimiter.encode()
+    plans = [(obj, ) + _plan(obj[0], obj[1], obj[2], chunk_size, num_chunks) for obj in objects]
+    probes = [(obj, offset) for obj, offsets, _ in plans for offset in offsets]
+
+    def find_boundary(probe):
+        (bucket_name, key, size), offset = probe
+        return _find_boundary(storage, bucket_name, key, size, offset, delimiter, probe_size)
+
+    boundaries = {}
+    if probes:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(probes)))) as executor:
+            for (obj, offset), boundary in zip(probes, executor.map(find_boundary, probes)):
+                boundaries.setdefault(obj[:2], []).append(boundary)
+
+    ranges = []
+    for obj, _, finalize in plans:
+        ranges.extend(finalize(boundaries.get(obj[:2], [])))
+    logger.debug('Partitioned {} objects in {} ranges with {} probes'.format(len(objects), len(ranges), len(probes)))
+    return ranges
+
+
+def partition_object(storage, bucket_name, key, chunk_size=aws_s3_config.PARTITION_CHUNKSIZE, num_chunks=None,
+                     delimiter=b'\n', probe_size=aws_s3_config.PARTITION_PROBE_SIZE,
+                     max_concurrency=aws_s3_config.BULK_MAX_CONCURRENCY):
+    """
+    Splits an object in byte ranges of about 'chunk_size' bytes (or in 'num_chunks' ranges),
+    aligned to the end of a delimiter, so that no record is split across ranges.
+    Planning only reads a small probe around every nominal boundary.
+    :param storage: storage backend (S3Backend)
+    :param delimiter: record delimiter
+    :type delimiter: str/bytes
+    return : list of ByteRange
+    """
+    size = int(storage.head_object(bucket_name, key)['content-length'])
+    return _align(storage, [(bucket_name, key, size)], chunk_size, num_chunks, delimiter,
+                  probe_size, max_concurrency)
+
+
+def partition_prefix(storage, bucket_name, prefix, chunk_size=aws_s3_config.PARTITION_CHUNKSIZE,
+                     delimiter=b'\n', probe_size=aws_s3_config.PARTITION_PROBE_SIZE,
+                     max_concurrency=aws_s3_config.BULK_MAX_CONCURRENCY):
+    """
+    Splits every object under a prefix in record-aligned byte ranges of about 'chunk_size' bytes.
+    Objects smaller than 'chunk_size' make a single range; empty objects are skipped.
+    return : list of ByteRange, in key order
+    """
+    objects = [(bucket_name, obj['Key'], obj['Size'])
+               for obj in storage.iter_objects(bucket_name, prefix) if obj['Size'] > 0]
+    return _align(storage, objects, chunk_size, None, delimiter, probe_size, max_concurrency)
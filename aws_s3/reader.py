@@ -0,0 +1,210 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import io
+import logging
+import threading
+import botocore
+from concurrent.futures import ThreadPoolExecutor
+from ..utils import StorageNoSuchKeyError
+from . import config as aws_s3_config
+
+logger = logging.getLogger(__name__)
+
+
+class S3RangeReader(io.RawIOBase):
+    """
+    Seekable, read-only raw file of an S3 object. The object is read in fixed-size blocks
+    with Range GETs. While it is read sequentially, the next 'readahead' blocks are fetched
+    in the background. Block buffers are recycled, so at most 'readahead' + 2 blocks are
+    allocated. Every request is pinned to the ETag seen when the reader was opened.
+    Wrap it in io.BufferedReader (see S3Backend.open_object()) for efficient small reads.
+    """
+
+    def __init__(self, s3_client, bucket_name, key, block_size=aws_s3_config.READER_BLOCKSIZE,
+                 readahead=aws_s3_config.READER_READAHEAD, max_retries=aws_s3_config.MAX_RETRIES):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.block_size = block_size
+        self.readahead = readahead
+        self.max_retries = max(1, max_retries)
+
+        try:
+            metadata = s3_client.head_object(Bucket=bucket_name, Key=key)
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == '404':
+                raise StorageNoSuchKeyError(bucket_name, key)
+            else:
+                raise e
+        self.size = metadata['ContentLength']
+        self.etag = metadata['ETag']
+
+        self._position = 0
+        self._blocks = {}
+        self._free_buffers = []
+        self._buffers_lock = threading.Lock()
+        self._last_block = None
+        self._executor = ThreadPoolExecutor(max_workers=max(1, readahead)) if readahead else None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError('Invalid whence ({})'.format(whence))
+        if position < 0:
+            raise ValueError('Negative seek position {}'.format(position))
+        self._position = position
+        return position
+
+    def _get_buffer(self):
+        with self._buffers_lock:
+            if self._free_buffers:
+                return self._free_buffers.pop()
+        return bytearray(self.block_size)
+
+    def _release_buffer(self, future):
+        if not future.cancelled() and future.exception() is None:
+            with self._buffers_lock:
+                self._free_buffers.append(future.result()[0])
+
+    def _fetch_block(self, index):
+        """
+        Reads a block into a recycled buffer
+        return : (buffer, length)
+        """
+        start = index * self.block_size
+        end = min(start + self.block_size, self.size) - 1
+        buffer = self._get_buffer()
+        view = memoryview(buffer)
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                r = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.key, IfMatch=self.etag,
+                                              Range='bytes={}-{}'.format(start, end))
+                offset = 0
+                for chunk in r['Body'].iter_chunks(aws_s3_config.READ_BLOCKSIZE):
+                    view[offset:offset+len(chunk)] = chunk
+                    offset += len(chunk)
+                if offset != end - start + 1:
+                    raise Exception('Incomplete read: got {} of {} bytes'.format(offset, end - start + 1))
+                return buffer, offset
+            except botocore.exceptions.ClientError as e:
+                if e.response['Error']['Code'] == 'NoSuchKey':
+                    raise StorageNoSuchKeyError(self.bucket_name, self.key)
+                if e.response['Error']['Code'] == 'PreconditionFailed':
+                    raise Exception('Object {} changed while it was being read'.format(self.key))
+                last_error = e
+            except Exception as e:
+                last_error = e
+            logger.debug('GET Object {} - Range {}-{} failed (attempt {}/{}): {}'
+                         .format(self.key, start, end, attempt, self.max_retries, last_error))
+        raise last_error
+
+    def _schedule(self, index):
+        if index not in self._blocks and index * self.block_size < self.size:
+            if self._executor is not None:
+                self._blocks[index] = self._executor.submit(self._fetch_block, index)
+            else:
+                self._blocks[index] = _CompletedFetch(self._fetch_block(index))
+
+    def _drop(self, index):
+        future = self._blocks.pop(index)
+        if not future.cancel():
+            future.add_done_callback(self._release_buffer)
+
+    def _get_block(self, index):
+        """
+        return : (buffer, length) of a block, and keeps the readahead window ahead of it
+        """
+        if index == self._last_block and index in self._blocks:
+            return self._blocks[index].result()
+        sequential = self._last_block is not None and index == self._last_block + 1
+        window = range(index, index + 1 + (self.readahead if sequential else 0))
+        for cached_index in list(self._blocks):
+            if cached_index not in window:
+                self._drop(cached_index)
+        for block_index in window:
+            self._schedule(block_index)
+        self._last_block = index
+        return self._blocks[index].result()
+
+    def readinto(self, b):
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+        if self._position >= self.size:
+            return 0
+        view = memoryview(b).cast('B')
+        index, block_offset = divmod(self._position, self.block_size)
+        buffer, length = self._get_block(index)
+        count = min(len(view), length - block_offset)
+        view[:count] = memoryview(buffer)[block_offset:block_offset+count]
+        self._position += count
+        return count
+
+    def readall(self):
+        chunks = []
+        while True:
+            chunk = self.read(self.block_size)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    def close(self):
+        if not self.closed:
+            for index in list(self._blocks):
+                self._drop(index)
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._free_buffers = []
+        super().close()
+
+
+class _CompletedFetch:
+    """
+    Result of a block read synchronously (readahead disabled), with the Future interface used by the reader
+    """
+
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+    def cancel(self):
+        return False
+
+    def cancelled(self):
+        return False
+
+    def exception(self):
+        return None
+
+    def add_done_callback(self, callback):
+        callback(self)
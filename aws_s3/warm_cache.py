@@ -0,0 +1,187 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from . import config as aws_s3_config
+
+logger = logging.getLogger(__name__)
+
+
+class WarmObjectCache:
+    """
+    Process-wide cache of immutable objects (e.g. function pickles) that outlives
+    a single function invocation. Only the keys explicitly pinned are cached. Entries
+    are grouped by namespace (e.g. executor ID) and stored at a fixed path under a local
+    directory, which is the source of truth: objects cached by forked job runners are
+    found by their parent and the next runners. Read objects are also kept in memory.
+    To stay under a size limit (checked against the directory contents), whole namespaces
+    are evicted, least recently used first; when a single namespace is left, its least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir=aws_s3_config.WARM_CACHE_DIR, max_bytes=aws_s3_config.WARM_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pinned = {}
+        self._memory = OrderedDict()
+        self._size = 0
+
+    def _entry_path(self, namespace, bucket_name, key):
+        entry_id = hashlib.sha256('{}/{}'.format(bucket_name, key).encode()).hexdigest()
+        return os.path.join(self.cache_dir, namespace, entry_id)
+
+    def pin(self, namespace, bucket_name, key):
+        """
+        Mark an object as immutable, so it is cached the next time it is read
+        """
+        with self._lock:
+            self._pinned[(bucket_name, key)] = namespace
+
+    def is_pinned(self, bucket_name, key):
+        return (bucket_name, key) in self._pinned
+
+    def get(self, bucket_name, key):
+        """
+        return : cached data, or None
+        """
+        with self._lock:
+            namespace = self._pinned.get((bucket_name, key))
+            if namespace is None:
+                return None
+            data = self._memory.get((bucket_name, key))
+            if data is not None:
+                self._memory.move_to_end((bucket_name, key))
+        path = self._entry_path(namespace, bucket_name, key)
+        try:
+            if data is None:
+                with open(path, 'rb') as entry_file:
+                    data = entry_file.read()
+                self._remember(bucket_name, key, data)
+            # The modification time orders entries for eviction
+            os.utime(path)
+        except (IOError, OSError):
+            pass
+        return data
+
+    def put(self, bucket_name, key, data):
+        with self._lock:
+            namespace = self._pinned.get((bucket_name, key))
+        if namespace is None or len(data) > self.max_bytes:
+            return
+        data = bytes(data)
+        self._remember(bucket_name, key, data)
+        path = self._entry_path(namespace, bucket_name, key)
+        if not os.path.exists(path):
+            self._persist(path, key, data)
+
+    def _remember(self, bucket_name, key, data):
+        """
+        Keeps an object in memory, evicting the least recently used ones above the size limit
+        """
+        with self._lock:
+            if (bucket_name, key) in self._memory:
+                return
+            self._memory[(bucket_name, key)] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _forget(self, entries):
+        with self._lock:
+            for entry in entries:
+                data = self._memory.pop(entry, None)
+                self._size -= len(data) if data is not None else 0
+
+    def _persist(self, path, key, data):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as entry_file:
+                entry_file.write(data)
+            os.replace(tmp_path, path)
+        except (IOError, OSError) as e:
+            logger.debug('Unable to persist cached object {}: {}'.format(key, e))
+            return
+        self._evict(keep=path)
+
+    def _scan(self):
+        """
+        return : dict of {namespace: list of (mtime, size, path)} of the entries on disk
+        """
+        namespaces = {}
+        try:
+            namespace_dirs = [entry for entry in os.scandir(self.cache_dir) if entry.is_dir()]
+        except OSError:
+            return namespaces
+        for namespace_dir in namespace_dirs:
+            entries = []
+            try:
+                for entry in os.scandir(namespace_dir.path):
+                    if entry.is_file() and not entry.name.startswith('.tmp-'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+            except OSError:
+                continue
+            namespaces[namespace_dir.name] = sorted(entries)
+        return namespaces
+
+    def _evict(self, keep=None):
+        """
+        Evicts entries from disk until the directory is under the size limit
+        """
+        namespaces = self._scan()
+        size = sum(entry[1] for entries in namespaces.values() for entry in entries)
+        if size <= self.max_bytes:
+            return
+
+        # Least recently used namespaces first (by their newest entry)
+        order = sorted(namespaces, key=lambda n: max([e[0] for e in namespaces[n]], default=0))
+        while size > self.max_bytes and len(order) > 1:
+            namespace = order.pop(0)
+            size -= sum(entry[1] for entry in namespaces[namespace])
+            self.release(namespace)
+        for mtime, entry_size, path in namespaces[order[0]]:
+            if size <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                size -= entry_size
+            except OSError:
+                pass
+
+    def release(self, namespace):
+        """
+        Drop every cached object of a namespace
+        """
+        with self._lock:
+            entries = [entry for entry, entry_namespace in self._pinned.items() if entry_namespace == namespace]
+            for entry in entries:
+                del self._pinned[entry]
+        self._forget(entries)
+        shutil.rmtree(os.path.join(self.cache_dir, namespace), ignore_errors=True)
+
+
+warm_objects = WarmObjectCache()
@@ -0,0 +1,233 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Offline benchmarks of the S3 and Lambda backends (installed with install_plugin.py).
+
+By default both backends run against the in-process stubs of stubs.py, with the
+latency and bandwidth given on the command line. Throttling and error rates are set
+separately for Lambda (--throttle-rate, --error-rate) and S3 (--s3-throttle-rate,
+--s3-error-rate). The S3 benchmarks can also run against a local S3-compatible server
+(e.g. MinIO) with --endpoint.
+Results are written as JSON, and can be compared with a previous run with --compare.
+
+    python benchmarks/run_benchmarks.py --latency 0.02 --output results.json
+    python benchmarks/run_benchmarks.py --latency 0.02 --compare results.json
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import platform
+import boto3
+import botocore
+import pywren_ibm_cloud
+from pywren_ibm_cloud.storage.backends.aws_s3 import StorageBackend
+from pywren_ibm_cloud.compute.backends.aws_lambda import ComputeBackend
+from pywren_ibm_cloud.compute.backends.aws_lambda import config as aws_lambda_config
+from stubs import FaultInjector, StubS3Client, StubLambdaClient
+
+KB = 1024
+MB = 1024 ** 2
+
+
+def create_storage_backend(args, faults):
+    s3_config = {'endpoint': 'https://s3.amazonaws.com',
+                 'access_key_id': args.access_key_id,
+                 'secret_access_key': args.secret_access_key,
+                 'parallel_get': args.parallel_get}
+    storage = StorageBackend(s3_config)
+    if args.endpoint:
+        client_config = botocore.client.Config(max_pool_connections=128)
+        storage.s3_client = boto3.client('s3', endpoint_url=args.endpoint, config=client_config,
+                                         aws_access_key_id=args.access_key_id,
+                                         aws_secret_access_key=args.secret_access_key)
+    else:
+        storage.s3_client = StubS3Client(faults)
+    return storage
+
+
+def create_compute_backend(args, faults):
+    config_data = {'pywren': {},
+                   'aws': {'access_key_id': args.access_key_id,
+                           'secret_access_key': args.secret_access_key},
+                   'aws_lambda': {'execution_role': 'arn:aws:iam::000000000000:role/benchmark',
+                                  'region_name': 'us-east-1'}}
+    if args.shards > 1:
+        config_data['aws_lambda']['targets'] = [{'region_name': 'us-east-1', 'name': 'shard-{}'.format(i)}
+                                                for i in range(args.shards)]
+    aws_lambda_config.load_config(config_data)
+    compute = ComputeBackend(config_data['aws_lambda'])
+    for backend in getattr(compute, 'shards', {'': compute}).values():
+        backend.client = StubLambdaClient(faults)
+    return compute
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+
+def bench_put_get(storage, bucket, sizes, repetitions):
+    results = []
+    for size in sizes:
+        data = os.urandom(size)
+        key = 'benchmark/{}/object-{}'.format(uuid.uuid4().hex, size)
+        put_times, get_times = [], []
+        for _ in range(repetitions):
+            put_times.append(timed(storage.put_object, bucket, key, data)[0])
+            get_times.append(timed(storage.get_object, bucket, key)[0])
+        storage.delete_object(bucket, key)
+        for operation, times in (('put', put_times), ('get', get_times)):
+            seconds = min(times)
+            results.append({'benchmark': '{}_object'.format(operation), 'size': size, 'seconds': seconds,
+                            'throughput_mb_s': size / MB / seconds if seconds else None})
+    return results
+
+
+def bench_bulk(storage, bucket, num_objects, size):
+    prefix = 'benchmark/{}/bulk/'.format(uuid.uuid4().hex)
+    objects = {'{}{:06d}'.format(prefix, i): os.urandom(size) for i in range(num_objects)}
+    put_seconds, _ = timed(lambda: list(storage.put_objects(bucket, objects)))
+    get_seconds, _ = timed(lambda: list(storage.get_objects(bucket, list(objects))))
+    storage.delete_objects(bucket, list(objects))
+    return [{'benchmark': 'put_objects', 'objects': num_objects, 'size': size, 'seconds': put_seconds,
+             'objects_s': num_objects / put_seconds if put_seconds else None},
+            {'benchmark': 'get_objects', 'objects': num_objects, 'size': size, 'seconds': get_seconds,
+             'objects_s': num_objects / get_seconds if get_seconds else None}]
+
+
+def bench_list_delete(storage, bucket, key_counts, shards=16):
+    results = []
+    for key_count in key_counts:
+        prefix = 'benchmark/{}/list/'.format(uuid.uuid4().hex)
+        keys = ['{}{:02d}/{:08d}'.format(prefix, i % shards, i) for i in range(key_count)]
+        failed_puts = [key for key, error in storage.put_objects(bucket, {key: b'' for key in keys})
+                       if isinstance(error, Exception)]
+        if failed_puts:
+            print('bench_list_delete: {} of {} keys could not be stored, first error on {}'
+                  .format(len(failed_puts), key_count, failed_puts[0]), file=sys.stderr)
+
+        list_seconds, listed = timed(storage.list_keys, bucket, prefix)
+        parallel_seconds, _ = timed(lambda: list(storage.iter_keys_parallel(bucket, prefix)))
+        delete_seconds, summary = timed(storage.delete_objects, bucket, keys)
+        results.extend([
+            {'benchmark': 'list_keys', 'keys': key_count, 'seconds': list_seconds,
+             'failed_puts': len(failed_puts), 'listed': len(listed)},
+            {'benchmark': 'list_keys_parallel', 'keys': key_count, 'shards': shards, 'seconds': parallel_seconds},
+            {'benchmark': 'delete_objects', 'keys': key_count, 'seconds': delete_seconds,
+             'keys_s': key_count / delete_seconds if delete_seconds else None,
+             'failed': len(summary['Errors'])}
+        ])
+    return results
+
+
+def bench_invoke(compute, invocations):
+    payloads = [{'executor_id': 'benchmark', 'job_id': 'A000', 'call_id': '{:05d}'.format(i)}
+                for i in range(invocations)]
+    seconds, activation_ids = timed(compute.invoke_batch, 'python3.8', 256, payloads)
+    failed = sum(1 for activation_id in activation_ids if isinstance(activation_id, Exception))
+    return [{'benchmark': 'invoke_batch', 'invocations': invocations, 'shards': len(getattr(compute, 'shards', [1])),
+             'seconds': seconds,
+             'invocations_s': invocations / seconds if seconds else None, 'failed': failed,
+             'rate_controller': compute.invocation_stats()}]
+
+
+def compare(results, baseline_path):
+    """
+    Prints the ratio of every timing to the same benchmark in a previous run
+    """
+    with open(baseline_path, 'r') as baseline_file:
+        baseline = json.load(baseline_file)
+
+    def benchmark_id(result):
+        return tuple(sorted((k, v) for k, v in result.items()
+                            if not isinstance(v, (float, dict)) and k not in ('failed', 'failed_puts', 'listed')))
+
+    previous = {benchmark_id(r): r for r in baseline['results']}
+    for result in results:
+        old = previous.get(benchmark_id(result))
+        if old and old['seconds']:
+            ratio = result['seconds'] / old['seconds']
+            flag = '  <-- regression' if ratio > 1.1 else ''
+            print('{:<60} {:>9.4f}s  x{:.2f}{}'.format(str(dict(benchmark_id(result))), result['seconds'], ratio, flag))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the AWS S3 and Lambda backends offline')
+    parser.add_argument('--endpoint', help='Local S3-compatible endpoint (default: in-process stub)')
+    parser.add_argument('--bucket', default='benchmark')
+    parser.add_argument('--access-key-id', default='benchmark')
+    parser.add_argument('--secret-access-key', default='benchmark')
+    parser.add_argument('--latency', type=float, default=0.0, help='Stub latency per request (s)')
+    parser.add_argument('--bandwidth', type=float, default=None, help='Stub bandwidth per request (MB/s)')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Lambda stub throttled request ratio')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Lambda stub failed request ratio')
+    parser.add_argument('--s3-throttle-rate', type=float, default=0.0, help='S3 stub throttled request ratio')
+    parser.add_argument('--s3-error-rate', type=float, default=0.0, help='S3 stub failed request ratio')
+    parser.add_argument('--parallel-get', action='store_true', help='Enable parallel byte-range downloads')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[KB, 64 * KB, MB, 16 * MB, 96 * MB])
+    parser.add_argument('--repetitions', type=int, default=3)
+    parser.add_argument('--bulk-objects', type=int, default=2000)
+    parser.add_argument('--key-counts', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--invocations', type=int, default=1000)
+    parser.add_argument('--shards', type=int, default=1, help='Spread invocations over N sharded targets')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='Previous results file to compare with')
+    args = parser.parse_args()
+
+    bandwidth = args.bandwidth * MB if args.bandwidth else None
+    s3_faults = FaultInjector(latency=args.latency, bandwidth=bandwidth,
+                              throttle_rate=args.s3_throttle_rate,
+                              error_rate=args.s3_error_rate, seed=0)
+    lambda_faults = FaultInjector(latency=args.latency, bandwidth=bandwidth,
+                                  throttle_rate=args.throttle_rate,
+                                  error_rate=args.error_rate, seed=1)
+    storage = create_storage_backend(args, s3_faults)
+    compute = create_compute_backend(args, lambda_faults)
+
+    results = []
+    results += bench_put_get(storage, args.bucket, args.sizes, args.repetitions)
+    results += bench_bulk(storage, args.bucket, args.bulk_objects, KB)
+    results += bench_list_delete(storage, args.bucket, args.key_counts)
+    results += bench_invoke(compute, args.invocations)
+
+    report = {'timestamp': time.time(),
+              'environment': {'python': platform.python_version(),
+                              'platform': platform.platform(),
+                              'pywren': pywren_ibm_cloud.__version__,
+                              'boto3': boto3.__version__,
+                              'storage': args.endpoint or 'stub'},
+              'parameters': {k: v for k, v in vars(args).items() if k not in ('access_key_id', 'secret_access_key')},
+              'requests': {'s3': s3_faults.stats(), 'lambda': lambda_faults.stats()},
+              'results': results}
+
+    for result in results:
+        print(json.dumps(result))
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    print('Results written to {}'.format(args.output))
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,263 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+In-process stand-ins for the boto3 S3 and Lambda clients used by the backends,
+with injectable latency, bandwidth, throttling and error rates.
+"""
+
+import io
+import time
+import uuid
+import random
+import hashlib
+import threading
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+
+class FaultInjector:
+    """
+    Simulates the network: every request sleeps 'latency' seconds (plus the transfer time
+    of its payload at 'bandwidth' bytes/s), and fails with the given throttle/error rates
+    """
+
+    def __init__(self, latency=0.0, bandwidth=None, throttle_rate=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.failed = 0
+
+    def request(self, operation, size=0, throttle_code='SlowDown', throttle_status=503):
+        with self.lock:
+            self.requests += 1
+            draw = self.random.random()
+        delay = self.latency + (size / self.bandwidth if self.bandwidth else 0)
+        if delay:
+            time.sleep(delay)
+        if draw < self.throttle_rate:
+            with self.lock:
+                self.throttled += 1
+            raise client_error(throttle_code, throttle_status, operation)
+        if draw < self.throttle_rate + self.error_rate:
+            with self.lock:
+                self.failed += 1
+            raise client_error('InternalError', 500, operation)
+
+    def stats(self):
+        return {'requests': self.requests, 'throttled': self.throttled, 'failed': self.failed}
+
+
+def client_error(code, status, operation, message=''):
+    return ClientError({'Error': {'Code': code, 'Message': message},
+                        'ResponseMetadata': {'HTTPStatusCode': status}}, operation)
+
+
+def response(status=200, **fields):
+    return {'ResponseMetadata': {'HTTPStatusCode': status, 'RequestId': uuid.uuid4().hex,
+                                 'HTTPHeaders': {}}, **fields}
+
+
+class StubPaginator:
+
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, **kwargs):
+        token = None
+        while True:
+            page = self.client.list_objects_v2(ContinuationToken=token, **kwargs)
+            yield page
+            if not page['IsTruncated']:
+                return
+            token = page['NextContinuationToken']
+
+
+class StubS3Client:
+    """
+    In-memory S3 client: objects, byte ranges, conditional reads, multipart uploads,
+    batch deletes and paginated (delimited) listings
+    """
+
+    def __init__(self, faults=None, page_size=1000):
+        self.faults = faults or FaultInjector()
+        self.page_size = page_size
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.uploads = {}
+
+    def _objects(self, bucket):
+        return self.buckets.setdefault(bucket, {})
+
+    def _get(self, bucket, key, operation):
+        with self.lock:
+            obj = self._objects(bucket).get(key)
+        if obj is None:
+            raise client_error('NoSuchKey' if operation == 'GetObject' else '404', 404, operation)
+        return obj
+
+    def head_bucket(self, Bucket):
+        self.faults.request('HeadBucket')
+        return response()
+
+    def put_object(self, Bucket, Key, Body=b''):
+        data = Body.encode() if isinstance(Body, str) else bytes(Body)
+        self.faults.request('PutObject', len(data))
+        etag = '"{}"'.format(hashlib.md5(data).hexdigest())
+        with self.lock:
+            self._objects(Bucket)[Key] = {'Body': data, 'ETag': etag, 'LastModified': time.time()}
+        return response(ETag=etag)
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self.faults.request('HeadObject')
+        obj = self._get(Bucket, Key, 'HeadObject')
+        res = response(ContentLength=len(obj['Body']), ETag=obj['ETag'])
+        res['ResponseMetadata']['HTTPHeaders'] = {'content-length': str(len(obj['Body'])), 'etag': obj['ETag']}
+        return res
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, IfNoneMatch=None, **kwargs):
+        obj = self._get(Bucket, Key, 'GetObject')
+        if IfMatch is not None and IfMatch != obj['ETag']:
+            raise client_error('PreconditionFailed', 412, 'GetObject')
+        if IfNoneMatch is not None and IfNoneMatch == obj['ETag']:
+            self.faults.request('GetObject')
+            raise client_error('304', 304, 'GetObject')
+        data = obj['Body']
+        size = len(data)
+        start, end = 0, size - 1
+        if Range is not None:
+            start, end = Range.replace('bytes=', '').split('-')
+            if start == '':
+                start, end = max(0, size - int(end)), size - 1
+            else:
+                start, end = int(start), min(int(end) if end else size - 1, size - 1)
+            data = data[start:end + 1]
+        self.faults.request('GetObject', len(data))
+        return response(Body=StreamingBody(io.BytesIO(data), len(data)), ContentLength=len(data),
+                        ETag=obj['ETag'], ContentRange='bytes {}-{}/{}'.format(start, end, size))
+
+    def delete_object(self, Bucket, Key):
+        self.faults.request('DeleteObject')
+        with self.lock:
+            self._objects(Bucket).pop(Key, None)
+        return response(204)
+
+    def delete_objects(self, Bucket, Delete):
+        self.faults.request('DeleteObjects')
+        deleted = []
+        with self.lock:
+            objects = self._objects(Bucket)
+            for item in Delete['Objects']:
+                objects.pop(item['Key'], None)
+                deleted.append({'Key': item['Key']})
+        return response(Deleted=[] if Delete.get('Quiet') else deleted)
+
+    def get_paginator(self, operation):
+        return StubPaginator(self)
+
+    def list_objects_v2(self, Bucket, Prefix='', Delimiter=None, StartAfter=None,
+                        ContinuationToken=None, MaxKeys=None):
+        self.faults.request('ListObjectsV2')
+        max_keys = MaxKeys or self.page_size
+        with self.lock:
+            keys = sorted(k for k in self._objects(Bucket) if k.startswith(Prefix))
+            objects = dict(self._objects(Bucket))
+        after = ContinuationToken or StartAfter
+        if after:
+            keys = [k for k in keys if k > after]
+
+        contents, prefixes, last = [], [], None
+        for key in keys:
+            if Delimiter and Delimiter in key[len(Prefix):]:
+                common = key[:len(Prefix) + key[len(Prefix):].index(Delimiter) + len(Delimiter)]
+                if prefixes and prefixes[-1]['Prefix'] == common:
+                    # Keys rolled up into the last common prefix do not count
+                    last = key
+                    continue
+                if len(contents) + len(prefixes) >= max_keys:
+                    break
+                prefixes.append({'Prefix': common})
+                last = key
+                continue
+            if len(contents) + len(prefixes) >= max_keys:
+                break
+            last = key
+            obj = objects[key]
+            contents.append({'Key': key, 'Size': len(obj['Body']), 'ETag': obj['ETag'],
+                             'LastModified': obj['LastModified']})
+
+        truncated = last is not None and last != keys[-1]
+        page = response(KeyCount=len(contents), IsTruncated=truncated)
+        if contents:
+            page['Contents'] = contents
+        if prefixes:
+            page['CommonPrefixes'] = prefixes
+        if truncated:
+            page['NextContinuationToken'] = last
+        return page
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.faults.request('CreateMultipartUpload')
+        upload_id = uuid.uuid4().hex
+        with self.lock:
+            self.uploads[upload_id] = {}
+        return response(UploadId=upload_id)
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.faults.request('UploadPart', len(Body))
+        with self.lock:
+            self.uploads[UploadId][PartNumber] = bytes(Body)
+        return response(ETag='"{}"'.format(hashlib.md5(Body).hexdigest()))
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.faults.request('CompleteMultipartUpload')
+        with self.lock:
+            parts = self.uploads.pop(UploadId)
+        data = b''.join(parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+        with self.lock:
+            self._objects(Bucket)[Key] = {'Body': data, 'ETag': '"{}-{}"'.format(uuid.uuid4().hex, len(parts)),
+                                          'LastModified': time.time()}
+        return response()
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        with self.lock:
+            self.uploads.pop(UploadId, None)
+        return response(204)
+
+
+class StubLambdaClient:
+    """
+    Lambda client that accepts asynchronous invocations (HTTP 202), throttling them with
+    TooManyRequestsException at the configured rate
+    """
+
+    def __init__(self, faults=None):
+        self.faults = faults or FaultInjector()
+        self.lock = threading.Lock()
+        self.invocations = 0
+
+    def invoke(self, FunctionName, Payload, InvocationType='RequestResponse', **kwargs):
+        self.faults.request('Invoke', len(Payload), throttle_code='TooManyRequestsException', throttle_status=429)
+        with self.lock:
+            self.invocations += 1
+        if InvocationType == 'Event':
+            return response(202)
+        return response(200, Payload=StreamingBody(io.BytesIO(b'{}'), 2))
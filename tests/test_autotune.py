@@ -0,0 +1,88 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Tests of the Lambda cost model and the memory recommendation. Run them with pytest once
+the plugin is installed (python install_plugin.py).
+"""
+
+import pytest
+from pywren_ibm_cloud.compute.backends.aws_lambda.autotune import LambdaCostModel, recommend_memory
+
+
+def test_billed_duration_is_rounded_up():
+    cost_model = LambdaCostModel(billing_granularity=0.1)
+    assert cost_model.billed_duration(0.25) == pytest.approx(0.3)
+    assert cost_model.billed_duration(0.3) == pytest.approx(0.3)
+    assert cost_model.billed_duration(0) == pytest.approx(0.1)
+
+
+def test_cost_of_one_invocation():
+    cost_model = LambdaCostModel(price_per_gb_second=1.0, price_per_request=0.5, billing_granularity=0.001)
+    assert cost_model.cost(2048, 1.5) == pytest.approx(2 * 1.5 + 0.5)
+    assert cost_model.cost(512, 0.0004) == pytest.approx(0.5 * 0.001 + 0.5)
+
+
+# Durations (s) of a CPU-bound task: cheapest at 512 MB, fastest at 2048 MB
+TIMINGS = {256: [4.0, 4.2, 3.9],
+           512: [1.8, 1.9, 1.7],
+           1024: [1.0, 1.1, 0.9],
+           2048: [0.9, 1.0, 0.8]}
+
+
+def test_recommend_cheapest_memory():
+    cost_model = LambdaCostModel(price_per_gb_second=1.0, price_per_request=0.0)
+    recommendation = recommend_memory(TIMINGS, cost_model=cost_model)
+    assert recommendation['memory'] == 512
+    assert recommendation['objective'] == 'cost'
+    assert [c['memory'] for c in recommendation['candidates']] == [256, 512, 1024, 2048]
+
+
+def test_recommend_cheapest_memory_under_max_latency():
+    cost_model = LambdaCostModel(price_per_gb_second=1.0, price_per_request=0.0)
+    recommendation = recommend_memory(TIMINGS, max_latency=1.5, cost_model=cost_model)
+    assert recommendation['memory'] == 1024
+
+
+def test_recommend_fastest_memory_under_max_cost():
+    cost_model = LambdaCostModel(price_per_gb_second=1.0, price_per_request=0.0)
+    recommendation = recommend_memory(TIMINGS, objective='latency', cost_model=cost_model)
+    assert recommendation['memory'] == 2048
+
+    recommendation = recommend_memory(TIMINGS, objective='latency', max_cost=1.1, cost_model=cost_model)
+    assert recommendation['memory'] == 1024
+
+
+def test_recommend_uses_the_given_percentile():
+    timings = {256: [1.0, 1.0, 10.0], 512: [2.0, 2.0, 2.0]}
+    assert recommend_memory(timings, objective='latency', statistic=50)['memory'] == 256
+    assert recommend_memory(timings, objective='latency', statistic=99)['memory'] == 512
+
+
+def test_recommend_skips_sizes_without_samples():
+    recommendation = recommend_memory({256: [], 512: [1.0]})
+    assert recommendation['memory'] == 512
+    assert len(recommendation['candidates']) == 1
+
+
+def test_recommend_rejects_unmet_constraints():
+    with pytest.raises(Exception):
+        recommend_memory(TIMINGS, max_latency=0.1)
+
+
+def test_recommend_rejects_unknown_objective():
+    with pytest.raises(Exception):
+        recommend_memory(TIMINGS, objective='throughput')
@@ -0,0 +1,141 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Tests of the weighted shard scheduler. Run them with pytest once the plugin is
+installed (python install_plugin.py).
+"""
+
+import random
+from collections import Counter
+from pywren_ibm_cloud.compute.backends.aws_lambda.sharding import WeightedShardScheduler
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def create_scheduler(capacities, **kwargs):
+    clock = FakeClock()
+    scheduler = WeightedShardScheduler(capacities, clock=clock, rng=random.Random(0), **kwargs)
+    return scheduler, clock
+
+
+def test_selection_is_proportional_to_capacity():
+    scheduler, clock = create_scheduler({'a': 3000, 'b': 1000}, slot_ttl=1)
+    picks = Counter()
+    for _ in range(4000):
+        picks[scheduler.select()] += 1
+        clock.advance(1)
+    assert 0.7 < picks['a'] / 4000 < 0.8
+
+
+def test_weight_is_free_concurrency():
+    scheduler, clock = create_scheduler({'a': 10, 'b': 10}, slot_ttl=60)
+    for _ in range(4):
+        scheduler._slots['a'].append(clock())
+    assert scheduler.weights() == {'a': 6, 'b': 10}
+
+
+def test_saturated_shards_are_not_picked():
+    scheduler, clock = create_scheduler({'a': 2, 'b': 100}, slot_ttl=60)
+    picks = Counter(scheduler.select() for _ in range(50))
+    assert picks['a'] <= 2
+    assert picks['b'] >= 48
+
+
+def test_slots_expire_after_ttl():
+    scheduler, clock = create_scheduler({'a': 2}, slot_ttl=10)
+    scheduler.select()
+    scheduler.select()
+    assert scheduler.weights() == {'a': 0}
+    clock.advance(9.9)
+    assert scheduler.weights() == {'a': 0}
+    clock.advance(0.1)
+    assert scheduler.weights() == {'a': 2}
+
+
+def test_least_loaded_shard_is_picked_when_all_are_saturated():
+    scheduler, clock = create_scheduler({'a': 1, 'b': 4}, slot_ttl=60)
+    for _ in range(5):
+        scheduler.select()
+    assert scheduler.weights() == {'a': 0, 'b': 0}
+    # 'a': 1 / (1 + 1), 'b': 4 / (4 + 1)
+    assert scheduler.select() == 'b'
+
+
+def test_excluded_shards_are_not_picked():
+    scheduler, clock = create_scheduler({'a': 100, 'b': 100}, slot_ttl=60)
+    assert all(scheduler.select(exclude=['a']) == 'b' for _ in range(20))
+    assert scheduler.select(exclude=['a', 'b']) is None
+
+
+def test_throttle_cuts_the_weight_and_releases_the_slot():
+    scheduler, clock = create_scheduler({'a': 10, 'b': 10}, slot_ttl=60, throttle_decrease=0.5)
+    assert scheduler.select(exclude=['b']) == 'a'
+    scheduler.on_throttle('a')
+    assert scheduler.weights() == {'a': 5, 'b': 10}
+    scheduler.on_throttle('a')
+    assert scheduler.weights()['a'] == 2.5
+    stats = scheduler.stats()['a']
+    assert stats['throttles'] == 2
+    assert stats['in_flight'] == 0
+
+
+def test_throttle_factor_has_a_floor():
+    scheduler, clock = create_scheduler({'a': 100}, throttle_decrease=0.1)
+    for _ in range(10):
+        scheduler.on_throttle('a')
+    assert scheduler.stats()['a']['throttle_factor'] == 0.01
+
+
+def test_throttled_shard_recovers_with_successes():
+    scheduler, clock = create_scheduler({'a': 10}, slot_ttl=1, throttle_decrease=0.5, throttle_recovery=0.1)
+    scheduler.on_throttle('a')
+    scheduler.on_throttle('a')
+    assert scheduler.stats()['a']['throttle_factor'] == 0.25
+    for _ in range(5):
+        scheduler.on_success('a')
+    assert scheduler.stats()['a']['throttle_factor'] == 0.75
+    for _ in range(5):
+        scheduler.on_success('a')
+    assert scheduler.stats()['a']['throttle_factor'] == 1.0
+
+
+def test_throttled_shard_gets_less_traffic():
+    scheduler, clock = create_scheduler({'a': 1000, 'b': 1000}, slot_ttl=1, throttle_decrease=0.25,
+                                        throttle_recovery=0)
+    scheduler.on_throttle('a')
+    picks = Counter()
+    for _ in range(2000):
+        picks[scheduler.select()] += 1
+        clock.advance(1)
+    assert 0.15 < picks['a'] / 2000 < 0.25
+
+
+def test_error_releases_the_slot():
+    scheduler, clock = create_scheduler({'a': 1}, slot_ttl=60)
+    scheduler.select()
+    scheduler.on_error('a')
+    assert scheduler.weights() == {'a': 1}
+    assert scheduler.stats()['a']['errors'] == 1
@@ -0,0 +1,140 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Tests of the AIMD invocation rate controller. Run them with pytest once the plugin is
+installed (python install_plugin.py).
+"""
+
+from pywren_ibm_cloud.compute.backends.aws_lambda.throttling import InvocationRateController
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def test_additive_increase_once_per_congestion_window():
+    clock = FakeClock()
+    controller = InvocationRateController(initial_rate=100, additive_increase=10, decrease_window=0.1, clock=clock)
+    # A burst of successes within one congestion window only counts once
+    for _ in range(100):
+        controller.on_success()
+    assert controller.rate == 110
+    clock.advance(0.1)
+    controller.on_success()
+    assert controller.rate == 120
+
+
+def test_increase_does_not_depend_on_the_rate():
+    clock = FakeClock()
+    slow = InvocationRateController(initial_rate=10, additive_increase=5, decrease_window=0.1, clock=clock)
+    fast = InvocationRateController(initial_rate=1000, additive_increase=5, decrease_window=0.1, clock=clock)
+    for _ in range(10):
+        slow.on_success()
+        fast.on_success()
+        clock.advance(0.1)
+    assert slow.rate == 60
+    assert fast.rate == 1050
+
+
+def test_rate_is_capped_by_max_rate():
+    clock = FakeClock()
+    controller = InvocationRateController(initial_rate=100, max_rate=101, additive_increase=10, clock=clock)
+    for _ in range(10):
+        controller.on_success()
+        clock.advance(1)
+    assert controller.rate == 101
+
+
+def test_burst_of_throttles_decreases_once():
+    clock = FakeClock()
+    controller = InvocationRateController(initial_rate=500, decrease_window=0.1, clock=clock)
+    for _ in range(64):
+        controller.on_throttle()
+        clock.advance(0.001)
+    assert controller.rate == 250
+    assert controller.throttles == 64
+
+
+def test_decrease_once_per_congestion_window():
+    clock = FakeClock()
+    controller = InvocationRateController(initial_rate=400, decrease_window=0.1, clock=clock)
+    controller.on_throttle()
+    clock.advance(0.1)
+    controller.on_error()
+    clock.advance(0.05)
+    controller.on_throttle()
+    assert controller.rate == 100
+
+
+def test_congestion_window_follows_round_trip_time():
+    clock = FakeClock()
+    controller = InvocationRateController(initial_rate=400, decrease_window=0.1, clock=clock)
+    controller.on_throttle(rtt=0.5)
+    assert controller.congestion_window() == 0.5
+    clock.advance(0.2)
+    controller.on_throttle(rtt=0.5)
+    assert controller.rate == 200
+    clock.advance(0.3)
+    controller.on_throttle(rtt=0.5)
+    assert controller.rate == 100
+
+
+def test_rate_is_floored_by_min_rate():
+    clock = FakeClock()
+    controller = InvocationRateController(initial_rate=4, min_rate=1, decrease_window=0.1, clock=clock)
+    for _ in range(10):
+        controller.on_throttle()
+        clock.advance(1)
+    assert controller.rate == 1
+
+
+def test_retry_budget_is_sized_to_the_batch():
+    controller = InvocationRateController(retry_budget=2, clock=FakeClock())
+    controller.reserve_retries(5)
+    assert [controller.acquire_retry() for _ in range(6)] == [True] * 5 + [False]
+    assert controller.retries == 5
+
+
+def test_successes_refill_the_retry_budget():
+    controller = InvocationRateController(retry_budget=1, retry_ratio=0.5, clock=FakeClock())
+    assert controller.acquire_retry()
+    assert not controller.acquire_retry()
+    controller.on_success()
+    controller.on_success()
+    assert controller.acquire_retry()
+
+
+def test_backoff_is_bounded():
+    controller = InvocationRateController(backoff_base=0.1, backoff_max=1, clock=FakeClock())
+    for attempt in range(10):
+        assert 0 <= controller.backoff(attempt) <= min(1, 0.1 * 2 ** attempt)
+
+
+def test_acquire_spends_tokens_without_waiting():
+    clock = FakeClock()
+    controller = InvocationRateController(initial_rate=10, clock=clock)
+    clock.advance(1)
+    for _ in range(10):
+        controller.acquire()
+    assert controller.stats()['invocations'] == 10